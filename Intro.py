@@ -1,14 +1,10 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from utils.assets import responsive_image
+from utils.tracing import debug_panel, trace_page
 
 st.set_page_config(layout="wide")
+trace_page('intro')
 
 
 
@@ -18,7 +14,7 @@ st.markdown("<h2 style='text-align: center; color: black;'>Short Exploratory Dat
 st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("<br>", unsafe_allow_html=True)
 
-st.image("finalProjTitelBild.png")
+responsive_image("finalProjTitelBild.png")
 st.caption("""
 **Source:** [luminate-2022-u-s-year-end-report](https://luminatedata.com/reports/luminate-2022-u-s-year-end-report/)
  **Luminate U.S. Year-End Music Report for 2022**
@@ -27,7 +23,7 @@ st.caption("""
 st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("<br>", unsafe_allow_html=True)
 
-st.image("Discogs_logo.png")
+responsive_image("Discogs_logo.png")
 st.header('What is Discogs?')
 st.markdown("""
 Discogs is an online music database and marketplace that serves music collectors and enthusiasts. It was founded by Kevin Lewandowski in 2000. It initially started as a tool for tracking record collections and gradually grew into a worldwide music database and sales platform.
@@ -38,4 +34,6 @@ One of the significant features of Discogs is its wiki-style database that enabl
 
 Additionally, music recordings can be bought and sold on Discogs. Users can list their collections for sale or purchase music recordings from other users. This provides music collectors with the opportunity to find rare or special editions from a wide range of sources.
 
-Discogs has become a crucial resource for music enthusiasts and collectors, hosting a vast database with millions of music recordings from around the world. Despite changes in the music industry, Discogs continues to assist in preserving and sharing music.""")
\ No newline at end of file
+Discogs has become a crucial resource for music enthusiasts and collectors, hosting a vast database with millions of music recordings from around the world. Despite changes in the music industry, Discogs continues to assist in preserving and sharing music.""")
+
+debug_panel()
@@ -1,23 +1,24 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import plotly.express as px
-import plotly.graph_objects as go
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from utils.aggregates import DIGITAL_FORMATS, format_sales
+from utils.data import dataset_version, load_music_sales
+from utils.explorer import raw_data_explorer
+from utils.figures import cached_plotly_chart
+from utils.panels import lazy_tabs
+from utils.tracing import debug_panel, span, trace_page
 
 st.set_page_config(layout="wide")
+trace_page('music_sales')
 
-file_path = 'data/music_sales_clean.csv'
-music_sales_df = pd.read_csv(file_path)
+music_sales_df = load_music_sales()
+version = dataset_version('music_sales')
 
 
 st.title('Music Industry Trends in Sales by Format and Year (1973 - 2019)')
 
 if st.checkbox('Show raw data'):
-    st.write(music_sales_df)
+    raw_data_explorer(music_sales_df, f"music_sales-{version}")
 
 
 
@@ -32,16 +33,15 @@ st.caption("""
 
 
 
-physical_formats = ['LP/EP', 'Cassette', 'CD', 'Vinyl Single']
-digital_formats = ['Download Album', 'Download Single', 'Paid Subscription', 'On-Demand Streaming']
+digital_formats = DIGITAL_FORMATS
 
-# Filter the dataset for physical and digital formats
-filtered_df = music_sales_df[(music_sales_df['Format'].isin(physical_formats + digital_formats)) & 
-                             (music_sales_df['Metric'].isin(['Units', 'Value']))]
+with span("aggregate:formats"):
+    # Filter the dataset for physical and digital formats (shared with utils/api.py)
+    filtered_df = format_sales(music_sales_df)
 
-# Reshape the data for easier plotting with Plotly Express
-units_df = filtered_df[filtered_df['Metric'] == 'Units']
-value_df = filtered_df[filtered_df['Metric'] == 'Value']
+    # Reshape the data for easier plotting with Plotly Express
+    units_df = filtered_df[filtered_df['Metric'] == 'Units']
+    value_df = filtered_df[filtered_df['Metric'] == 'Value']
 
 # Streamlit app structure
 
@@ -52,36 +52,35 @@ In this section we are going to explore trends in the music industry over the la
 st.markdown("<br><br>", unsafe_allow_html=True)
 
 
-# Tab layout for switching between Units Sold and Revenue
-tab1, tab2 = st.tabs(["Units Sold", "Revenue"])
+def sales_trend_figure(df, y_label):
+    fig = px.line(df, x='Year', y='Value (Actual)', color='Format', 
+                  labels={'Value (Actual)': y_label, 'Format': 'Music Format'},
+                  line_dash='Format',
+                  width=1200, height=600)  # Adjust width and height for full-width display
+    fig.update_layout(xaxis_title='')
+    return fig
 
-with tab1:
+
+# Tab layout for switching between Units Sold and Revenue; only the selected tab is built
+sales_tab = lazy_tabs(["Units Sold", "Revenue"], key="sales_tab")
+
+if sales_tab == "Units Sold":
     st.header('Trend of Music Sales by Format Over Time (Units Sold)')
     st.markdown("""
     This visualization shows the number of units sold over time for different physical and digital formats. You can observe the decline in physical formats like CDs and the corresponding rise in digital formats, particularly streaming.
     """)
     
-    fig1 = px.line(units_df, x='Year', y='Value (Actual)', color='Format', 
-                   labels={'Value (Actual)': 'Units Sold (Millions)', 'Format': 'Music Format'},
-                   #title='Trend of Music Sales by Format Over Time (Units Sold)',
-                   line_dash='Format',
-                   width=1200, height=600)  # Adjust width and height for full-width display
-    fig1.update_layout(xaxis_title='')               
-    st.plotly_chart(fig1, use_container_width=True)
+    cached_plotly_chart("sales_units", version, lambda: sales_trend_figure(units_df, 'Units Sold (Millions)'),
+                        use_container_width=True)
 
-with tab2:
+elif sales_tab == "Revenue":
     st.header('Trend of Music Sales by Format Over Time (Revenue)')
     st.markdown("""
     This visualization tracks the revenue generated by different formats over time. It highlights the dramatic growth in revenue from streaming services, which has largely replaced the revenue from physical formats like CDs.
     """)
     
-    fig2 = px.line(value_df, x='Year', y='Value (Actual)', color='Format', 
-                   labels={'Value (Actual)': 'Revenue Generated (Millions USD)', 'Format': 'Music Format'},
-                   #title='Trend of Music Sales by Format Over Time (Revenue)',
-                   line_dash='Format',
-                   width=1200, height=600)  # Adjust width and height for full-width display
-    fig2.update_layout(xaxis_title='')
-    st.plotly_chart(fig2, use_container_width=True)
+    cached_plotly_chart("sales_revenue", version, lambda: sales_trend_figure(value_df, 'Revenue Generated (Millions USD)'),
+                        use_container_width=True)
 st.markdown("""
 **Units Sold vs. Revenue**:
 - **Units Sold**: This measures the number of physical or digital items sold, such as individual records, CDs, downloads, or subscriptions. It reflects consumer activity in purchasing or subscribing to music services.
@@ -95,18 +94,24 @@ st.markdown("""
 This visualization focuses on the rise of digital formats, including downloads and streaming, and their relationship with physical formats. As digital formats grew, particularly streaming, there was a significant decline in physical formats, especially CDs.
 """)
 
-# Filter the dataset for digital formats specifically
-digital_df = filtered_df[filtered_df['Format'].isin(digital_formats)]
+def digital_formats_figure():
+    # Filter the dataset for digital formats specifically
+    digital_df = filtered_df[filtered_df['Format'].isin(digital_formats)]
 
-fig3 = px.line(digital_df[digital_df['Metric'] == 'Value'], x='Year', y='Value (Actual)', color='Format', 
-               labels={'Value (Actual)': 'Revenue Generated (Millions USD)', 'Format': 'Digital Format'},
-               title='The Rise of Digital Formats (Revenue)',
-               width=1200, height=600)  # Adjust width and height for full-width display
-st.plotly_chart(fig3, use_container_width=True)
+    fig3 = px.line(digital_df[digital_df['Metric'] == 'Value'], x='Year', y='Value (Actual)', color='Format', 
+                   labels={'Value (Actual)': 'Revenue Generated (Millions USD)', 'Format': 'Digital Format'},
+                   title='The Rise of Digital Formats (Revenue)',
+                   width=1200, height=600)  # Adjust width and height for full-width display
+    return fig3
+
+
+cached_plotly_chart("digital_formats", version, digital_formats_figure, use_container_width=True)
 
 st.markdown("""
 **Key Insights**:
 - **Streaming's Dominance**: Streaming has become the dominant revenue stream in the music industry, surpassing all other formats, including physical and digital downloads.
 - **Impact on Physical Formats**: The rise of streaming, especially after 2010, coincides with the sharp decline in physical formats, particularly CDs.
 - **Transition from Downloads**: Digital downloads, which were popular in the early 2000s, have also seen a decline as streaming services became more prevalent.
-""")
\ No newline at end of file
+""")
+
+debug_panel()
@@ -1,44 +1,40 @@
 import streamlit as st
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import plotly.express as px
-import plotly.graph_objects as go
-import gdown
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from utils.aggregates import load_cube
+from utils.assets import responsive_image
+from utils.data import dataset_version, load_dataset
+from utils.explorer import raw_data_explorer
+from utils.figures import cached_plotly_chart
+from utils.filters import filter_panel, selection_key
+from utils.tracing import debug_panel, trace_page
 
 
 
 
 st.set_page_config(layout="wide")
+trace_page('discogs')
 
 
-# Define Google Drive file ID and URL
-file_id = '1Nj9VxvM0euJj2XRLfsEBh3Io5XhJniKW'
-url = f'https://drive.google.com/uc?id={file_id}'
-output = 'discogs_clean.csv'
+# The full catalogue is fetched once into the local dataset cache (see utils/fetch.py).
+# The charts only need its aggregates, which are scanned out-of-core once per
+# dataset version (see utils/engine.py), so the catalogue never sits in memory.
+# Only filtering the charts (in the sidebar) loads it, to index and re-aggregate
+# the selected releases.
+selection = filter_panel('discogs', key='discogs_filters')
+discogs_stats = load_cube('discogs', selection)
+discogs_version = dataset_version('discogs') + selection_key(selection)
 
-@st.cache_data
-def load_data_from_gdrive(url, output):
-    # Download the file from Google Drive
-    gdown.download(url, output, quiet=False)
-    # Load the CSV into a DataFrame
-    df_discogs = pd.read_csv(output)
-    return df_discogs
 
-# Load the data
-df_discogs = load_data_from_gdrive(url, output)
-
-
-st.image("Discogs_logo.png")
+responsive_image("Discogs_logo.png")
 
 st.title('Some General Insights into Discogs Catalogue')
 
 
 if st.checkbox('Show raw data'):
-    st.write(df_discogs)
+    # Paged on the server: only the visible rows are sent to the browser
+    raw_data_explorer(load_dataset('discogs'), f"discogs-{dataset_version('discogs')}")
 
 st.caption("""
 **Source:** [kaggle](https://www.kaggle.com/datasets/ofurkancoban/discogs-releases-dataset/data)
@@ -47,6 +43,15 @@ st.caption("""
 
 """)
 
+# Cubes built with AGGREGATE_SKETCHES=1 are approximate (see utils/sketches.py)
+if 'errors' in discogs_stats:
+    errors = discogs_stats['errors']
+    count_error = max(errors.get(key, 0) for key in ['genre_counts', 'format_counts', 'country_counts',
+                                                     'electronic_country_counts'])
+    st.caption(f"Approximate aggregates: release counts are at most {count_error:,} below the true counts, "
+               f"unique labels per year within ±{errors['year_genre_labels']:.1%} and unique styles within "
+               f"±{errors['year_styles']:.1%} (one standard error).")
+
 
 #for column in ['country', 'format', 'genre']:
 
@@ -56,8 +61,8 @@ st.caption("""
 
 
    
-def plot_top_genres(df):
-    genre_counts = df['genre'].value_counts().head(10)
+def plot_top_genres(stats):
+    genre_counts = stats['genre_counts'].head(10)
     fig = px.bar(
         genre_counts, 
         x=genre_counts.index, 
@@ -66,10 +71,10 @@ def plot_top_genres(df):
         color_discrete_sequence=['#A020F0']
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
-def plot_top_formats(df):
-    format_counts = df['format'].value_counts().head(5)
+def plot_top_formats(stats):
+    format_counts = stats['format_counts'].head(5)
     fig = px.bar(
         format_counts, 
         x=format_counts.index, 
@@ -78,20 +83,16 @@ def plot_top_formats(df):
         color_discrete_sequence=['#A020F0']
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
-def plot_top_countries_with_electronic(df):
+def plot_top_countries_with_electronic(stats):
     # Exclude 'Europe' and count total entries per country
-    total_counts = df_discogs[df_discogs['country'] != 'Europe']['country'].value_counts().reset_index().head(10)
+    country_counts = stats['country_counts']
+    total_counts = country_counts[country_counts.index != 'Europe'].reset_index().head(10)
     total_counts.columns = ['Country', 'Total Count']
 
     # Count 'Electronic' genre entries per country
-    electronic_counts = (
-        df_discogs[df_discogs['genre'] == 'Electronic']
-        .groupby('country')
-        .size()
-        .reset_index(name='Electronic Count')
-    )
+    electronic_counts = stats['electronic_country_counts'].reset_index(name='Electronic Count')
 
     # Merge the two counts
     merged_counts = pd.merge(total_counts, electronic_counts, how='left', left_on='Country', right_on='country')
@@ -113,40 +114,38 @@ def plot_top_countries_with_electronic(df):
         color_discrete_map={"Total Count": "#A020F0", "Electronic Count": "#F769DC"}
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
 
-def plot_releases_by_genre_and_year(df):
+def plot_releases_by_genre_and_year(stats):
     # Filter for top 10 genres based on overall count
-    top_genres = df['genre'].value_counts().head(10).index
-    
-    # Filter the DataFrame for these top genres and only up to the year 2020
-    filtered_df = df[(df['genre'].isin(top_genres)) & (df['release_year'] <= 2020)]
+    top_genres = stats['genre_counts'].head(10).index
     
-    # Group by year and genre
-    genre_year_grouped = filtered_df.groupby(['release_year', 'genre']).size().unstack(fill_value=0)
+    # Release counts per year (up to 2020) and genre, kept for the top genres
+    year_genre_counts = stats['year_genre_counts']
+    filtered_counts = year_genre_counts[year_genre_counts.index.get_level_values('genre').isin(top_genres)]
+    genre_year_grouped = filtered_counts.unstack(fill_value=0)
     
     # Plot the line chart
     fig = px.line(
         genre_year_grouped,
         x=genre_year_grouped.index,
-        y=[genre_year_grouped[col] for col in genre_year_grouped.columns],
-        labels={"value": "Number of Releases", "variable": "Genre", "index": ""},
+        y=genre_year_grouped.columns,
+        labels={"value": "Number of Releases", "variable": "Genre", "genre": "Genre", "index": ""},
         height=800  # Adjusted height for better visibility 
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
     
-def plot_labels_releasing_top_genres_over_time(df):
+def plot_labels_releasing_top_genres_over_time(stats):
     # Identify the top 5 genres based on the overall number of releases
-    top_genres = df['genre'].value_counts().head(5).index.tolist()
+    top_genres = stats['genre_counts'].head(5).index.tolist()
 
-    # Filter the DataFrame to include only the top 5 genres and years up to 2020
-    top_genre_df = df[(df['genre'].isin(top_genres)) & (df['release_year'] <= 2020)]
-
-    # Group by year and genre, and count unique labels for each genre per year
-    labels_per_year_genre = top_genre_df.groupby(['release_year', 'genre'])['label'].nunique().reset_index()
+    # Unique labels per year (up to 2020) and genre, kept for the top 5 genres
+    year_genre_labels = stats['year_genre_labels']
+    top_genre_labels = year_genre_labels[year_genre_labels.index.get_level_values('genre').isin(top_genres)]
+    labels_per_year_genre = top_genre_labels.reset_index()
 
     # Plot the line graph using Plotly Express
     fig = px.line(
@@ -158,22 +157,13 @@ def plot_labels_releasing_top_genres_over_time(df):
         height=800  # Adjusted for better visibility
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
 
 
-def plot_unique_styles_over_time(df):
-    # Filter for electronic genre and year <= 2020
-    electronic_df = df[(df['genre'] == 'Electronic') & (df['release_year'] <= 2020)]
-    
-    # Explode the 'styles' column which contains comma-separated values
-    electronic_df['styles'] = electronic_df['styles'].str.split(',').explode()
-    
-    # Drop any NA values that might result from empty styles fields
-    electronic_df = electronic_df.dropna(subset=['styles'])
-    
-    # Group by year and count unique styles
-    styles_per_year = electronic_df.groupby('release_year')['styles'].nunique().reset_index()
+def plot_unique_styles_over_time(stats):
+    # Unique styles of electronic releases per year (up to 2020)
+    styles_per_year = stats['year_styles'].reset_index()
     
     # Plot the line graph
     fig = px.line(
@@ -184,35 +174,42 @@ def plot_unique_styles_over_time(df):
         height=800 
     )
     fig.update_layout(xaxis_title=None)
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
 
 
 
 def main():
     st.subheader("Top 10 Genres")
-    plot_top_genres(df_discogs)
+    cached_plotly_chart("top_genres", discogs_version, lambda: plot_top_genres(discogs_stats),
+                        use_container_width=True)
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("Top 5 Formats")
-    plot_top_formats(df_discogs)
+    cached_plotly_chart("top_formats", discogs_version, lambda: plot_top_formats(discogs_stats),
+                        use_container_width=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("Top 10 Countries in Terms of Total Music Releases compared to Electronic Music Genre")
-    plot_top_countries_with_electronic(df_discogs)
+    cached_plotly_chart("top_countries_with_electronic", discogs_version, lambda: plot_top_countries_with_electronic(discogs_stats),
+                        use_container_width=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("Trends of Music Releases by Genre Over Years")
-    plot_releases_by_genre_and_year(df_discogs)
+    cached_plotly_chart("releases_by_genre_and_year", discogs_version, lambda: plot_releases_by_genre_and_year(discogs_stats),
+                        use_container_width=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("Number of Labels Issuing Releases by Genre and Year")
-    plot_labels_releasing_top_genres_over_time(df_discogs)
+    cached_plotly_chart("labels_releasing_top_genres_over_time", discogs_version, lambda: plot_labels_releasing_top_genres_over_time(discogs_stats),
+                        use_container_width=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("Analysis of Electronic Music Subgenres Over Time")
-    plot_unique_styles_over_time(df_discogs)
+    cached_plotly_chart("unique_styles_over_time", discogs_version, lambda: plot_unique_styles_over_time(discogs_stats),
+                        use_container_width=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    debug_panel()
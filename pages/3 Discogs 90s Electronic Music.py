@@ -1,47 +1,37 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import plotly.express as px
-import plotly.graph_objects as go
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from utils.aggregates import DISTRIBUTION_COLUMNS, load_cube, top_by_format
+from utils.assets import responsive_image
+from utils.charts import binned_histogram
+from utils.data import dataset_version, load_discogs_90s
+from utils.density import density_scatter, load_vinyl_points
+from utils.explorer import raw_data_explorer
+from utils.figures import cached_plotly_chart
+from utils.filters import filter_panel, selection_key
+from utils.panels import lazy_tabs
+from utils.tracing import debug_panel, span, trace_page
 
 st.set_page_config(layout="wide")
+trace_page('discogs_90s')
 
 
 
-file_path = 'data/discogs_electr_90s_clean.csv'
-df = pd.read_csv(file_path)
+df = load_discogs_90s()
 
-# Filter the data for only Vinyl format
-vinyl_data = df[df['format'] == 'Vinyl']
+# Optional sidebar filters: the charts are then drawn from the selected releases only
+selection = filter_panel('discogs_90s', key='discogs_90s_filters')
+
+# Aggregates are precomputed once per dataset version (see utils/aggregates.py)
+cube = load_cube('discogs_90s', selection)
+version = dataset_version('discogs_90s') + selection_key(selection)
 
 # Prepare data for the stacked bar graphs
-top_labels = df['label'].value_counts().head(15).index
-label_format_data = df[df['label'].isin(top_labels)]
-label_format_data = label_format_data.groupby(['label', 'format']).size().unstack(fill_value=0)
-
-top_formats = df['format'].value_counts().head(3).index
-label_format_data = label_format_data.loc[:, label_format_data.columns.isin(top_formats)]
-label_format_data['Total'] = label_format_data.sum(axis=1)
-label_format_data = label_format_data.sort_values(by='Total', ascending=False).drop(columns='Total')
-
-top_countries = df['country'].value_counts().head(15).index
-country_format_data = df[df['country'].isin(top_countries)]
-country_format_data = country_format_data.groupby(['country', 'format']).size().unstack(fill_value=0)
-country_format_data = country_format_data.loc[:, country_format_data.columns.isin(top_formats)]
-country_format_data['Total'] = country_format_data.sum(axis=1)
-country_format_data = country_format_data.sort_values(by='Total', ascending=False).drop(columns='Total')
-
-exploded_styles = df.assign(styles=df['styles'].str.split(',')).explode('styles')
-top_styles = exploded_styles['styles'].value_counts().head(20).index
-style_format_data = exploded_styles[exploded_styles['styles'].isin(top_styles)]
-style_format_data = style_format_data.groupby(['styles', 'format']).size().unstack(fill_value=0)
-style_format_data = style_format_data.loc[:, style_format_data.columns.isin(top_formats)]
-style_format_data['Total'] = style_format_data.sum(axis=1)
-style_format_data = style_format_data.sort_values(by='Total', ascending=False).drop(columns='Total')
+with span("aggregate:top by format"):
+    top_formats = cube['format_counts'].head(3).index
+    label_format_data = top_by_format(cube['label_format'], 15, top_formats)
+    country_format_data = top_by_format(cube['country_format'], 15, top_formats)
+    style_format_data = top_by_format(cube['style_format'], 20, top_formats)
 
 # Define custom colors
 custom_colors = {
@@ -54,7 +44,7 @@ custom_colors = {
 st.title("EDA for Discogs 90s Electronic Releases")
 
 if st.checkbox('Show raw data'):
-    st.write(df)
+    raw_data_explorer(df, f"discogs_90s-{dataset_version('discogs_90s')}")
 
 st.caption("""
 **Source:** [kaggle](https://www.kaggle.com/datasets/thedevastator/music-sales-by-format-and-year/data)
@@ -67,73 +57,79 @@ st.caption("""
 
 
 st.header("Some Basic Statistics")
-tab1, tab2, tab3 = st.tabs(["Top 15 Labels", "Top 15 Countries", "Top 20 Styles"])
+# Only the selected panel is built and sent (see utils/panels.py)
+basic_stats_tab = lazy_tabs(["Top 15 Labels", "Top 15 Countries", "Top 20 Styles"], key="basic_stats_tab")
+
+if basic_stats_tab == "Top 15 Labels":
+    cached_plotly_chart("top_labels", version, lambda: px.bar(
+        label_format_data, x=label_format_data.index, y=label_format_data.columns,
+        title="Top 15 Labels with Top 3 Formats",
+        labels={"value": "Number of Releases", "label": "Label"},
+        barmode="stack", color_discrete_map=custom_colors))
+
+elif basic_stats_tab == "Top 15 Countries":
+    cached_plotly_chart("top_countries", version, lambda: px.bar(
+        country_format_data, x=country_format_data.index, y=country_format_data.columns,
+        title="Top 15 Countries with Top 3 Formats",
+        labels={"value": "Number of Releases", "country": "Country"},
+        barmode="stack", color_discrete_map=custom_colors))
+
+elif basic_stats_tab == "Top 20 Styles":
+    cached_plotly_chart("top_styles", version, lambda: px.bar(
+        style_format_data, x=style_format_data.index, y=style_format_data.columns,
+        title="Top 20 Styles with Top 3 Formats",
+        labels={"value": "Number of Releases", "styles": "Style"},
+        barmode="stack", color_discrete_map=custom_colors))
 
-with tab1:
-    fig1 = px.bar(label_format_data, x=label_format_data.index, y=label_format_data.columns,
-                  title="Top 15 Labels with Top 3 Formats",
-                  labels={"value": "Number of Releases", "label": "Label"},
-                  barmode="stack", color_discrete_map=custom_colors)
-    st.plotly_chart(fig1)
+# Distribution over the years
+st.header("Distribution of Releases Over the Years")
 
-with tab2:
-    fig2 = px.bar(country_format_data, x=country_format_data.index, y=country_format_data.columns,
-                  title="Top 15 Countries with Top 3 Formats",
-                  labels={"value": "Number of Releases", "country": "Country"},
-                  barmode="stack", color_discrete_map=custom_colors)
-    st.plotly_chart(fig2)
 
-with tab3:
-    fig3 = px.bar(style_format_data, x=style_format_data.index, y=style_format_data.columns,
-                  title="Top 20 Styles with Top 3 Formats",
-                  labels={"value": "Number of Releases", "styles": "Style"},
+def year_format_figure():
+    year_format_data = cube['year_format']
+    year_format_data = year_format_data.loc[:, year_format_data.columns.isin(top_formats)]
+    fig4 = px.bar(year_format_data, x=year_format_data.index, y=year_format_data.columns,
+                  title="Distribution of Releases Over the Years with Top 3 Formats",
+                  labels={"value": "Number of Releases", "release_year": "Release Year"},
                   barmode="stack", color_discrete_map=custom_colors)
-    st.plotly_chart(fig3)
+    return fig4
 
-# Distribution over the years
-st.header("Distribution of Releases Over the Years")
-year_format_data = df.groupby(['release_year', 'format']).size().unstack(fill_value=0)
-year_format_data = year_format_data.loc[:, year_format_data.columns.isin(top_formats)]
 
-fig4 = px.bar(year_format_data, x=year_format_data.index, y=year_format_data.columns,
-              title="Distribution of Releases Over the Years with Top 3 Formats",
-              labels={"value": "Number of Releases", "release_year": "Release Year"},
-              barmode="stack", color_discrete_map=custom_colors)
-st.plotly_chart(fig4)
+cached_plotly_chart("year_format", version, year_format_figure)
 
 
 
 # Tabbed interface for Vinyl-specific analysis
 st.header("Vinyl-Specific Analysis")
-tab4, tab5, tab6 = st.tabs(["Average 'Have'", "Average 'Want'", "Average 'Median Price'"])
-
-avg_have_per_year = vinyl_data.groupby('release_year')['have'].mean()
-avg_want_per_year = vinyl_data.groupby('release_year')['want'].mean()
-avg_median_price_per_year = vinyl_data.groupby('release_year')['median price_(USD)'].mean()
+vinyl_tab = lazy_tabs(["Average 'Have'", "Average 'Want'", "Average 'Median Price'"], key="vinyl_tab")
 
 line_color = '#800080'  # Purple
 
-with tab4:
-    fig5 = px.line(avg_have_per_year, x=avg_have_per_year.index, y=avg_have_per_year.values,
-                   title='Average "Have" for Each Release Year (Vinyl Format)',
-                   labels={"x": "Release Year", "y": "Average 'Have'"}, line_shape="linear")
-    fig5.update_traces(line=dict(color=line_color))
-    st.plotly_chart(fig5)
-
-with tab5:
-    fig6 = px.line(avg_want_per_year, x=avg_want_per_year.index, y=avg_want_per_year.values,
-                   title='Average "Want" for Each Release Year (Vinyl Format)',
-                   labels={"x": "Release Year", "y": "Average 'Want'"}, line_shape="linear")
-    fig6.update_traces(line=dict(color=line_color))
-    st.plotly_chart(fig6)
-
-with tab6:
-    fig7 = px.line(avg_median_price_per_year, x=avg_median_price_per_year.index, y=avg_median_price_per_year.values,
-                   title='Average "Median Price (USD)" for Each Release Year (Vinyl Format)',
-                   labels={"x": "Release Year", "y": "Average Median Price (USD)"}, line_shape="linear")
-    fig7.update_traces(line=dict(color=line_color))
-    st.plotly_chart(fig7)
-st.image("discogs_statistics_screenshot.png")
+
+def vinyl_mean_figure(column, title, y_label):
+    avg_per_year = cube['vinyl_means'][column]
+    if avg_per_year.empty:
+        # A selection without vinyl releases
+        return px.line(title=title)
+    fig = px.line(avg_per_year, x=avg_per_year.index, y=avg_per_year.values, title=title,
+                  labels={"x": "Release Year", "y": y_label}, line_shape="linear")
+    fig.update_traces(line=dict(color=line_color))
+    return fig
+
+
+if vinyl_tab == "Average 'Have'":
+    cached_plotly_chart("vinyl_have", version, lambda: vinyl_mean_figure(
+        'have', 'Average "Have" for Each Release Year (Vinyl Format)', "Average 'Have'"))
+
+elif vinyl_tab == "Average 'Want'":
+    cached_plotly_chart("vinyl_want", version, lambda: vinyl_mean_figure(
+        'want', 'Average "Want" for Each Release Year (Vinyl Format)', "Average 'Want'"))
+
+elif vinyl_tab == "Average 'Median Price'":
+    cached_plotly_chart("vinyl_median_price", version, lambda: vinyl_mean_figure(
+        'median price_(USD)', 'Average "Median Price (USD)" for Each Release Year (Vinyl Format)',
+        "Average Median Price (USD)"))
+responsive_image("discogs_statistics_screenshot.png")
 st.markdown("""
 ### Analysis of Vinyl-Specific Metrics Over the Years
 
@@ -159,20 +155,19 @@ st.markdown("<br>", unsafe_allow_html=True)
 
 # Tabbed interface for distribution plots
 st.header("Distributions of key metrics for Vinyl Format")
-distribution_columns = ['have', 'want', 'lowest_price_(USD)', 'median price_(USD)', 'highest_price_(USD)', 'mean_rating']
+distribution_columns = DISTRIBUTION_COLUMNS
 distribution_titles = ["Distribution of 'Have'", "Distribution of 'Want'", "Distribution of 'Lowest Price (USD)'",
                        "Distribution of 'Median Price (USD)'", "Distribution of 'Highest Price (USD)'",
                        "Distribution of 'Mean Rating'"]
 
-tab7, tab8, tab9, tab10, tab11, tab12 = st.tabs(distribution_titles)
+distribution_tab = lazy_tabs(distribution_titles, key="distribution_tab")
 
-tabs = [tab7, tab8, tab9, tab10, tab11, tab12]
-
-for i, column in enumerate(distribution_columns):
-    with tabs[i]:
-        fig = px.histogram(vinyl_data, x=column, nbins=30, marginal="box", title=distribution_titles[i],
-                           labels={column: column.replace("_", " ").capitalize()}, color_discrete_sequence=['#F769DC'])
-        st.plotly_chart(fig)
+i = distribution_titles.index(distribution_tab)
+column = distribution_columns[i]
+# Binned and summarised on the server: the payload does not grow with the number of releases
+cached_plotly_chart(f"vinyl_distribution_{column}", version, lambda: binned_histogram(
+    cube['vinyl_histograms'][column], title=distribution_titles[i],
+    label=column.replace("_", " ").capitalize(), color='#F769DC'))
 st.markdown("""
 ### Analysis of Vinyl-Specific Distributions
 
@@ -212,14 +207,12 @@ st.markdown("<br>", unsafe_allow_html=True)
 
 # Correlation matrix
 st.header("Correlation Matrix for Vinyl Releases")
-correlation_columns = ['have', 'want', 'lowest_price_(USD)', 'median price_(USD)', 'highest_price_(USD)', 'mean_rating', 'num_ratings', 'release_year']
-correlation_data = vinyl_data[correlation_columns]
-correlation_matrix = correlation_data.corr()
+correlation_matrix = cube['vinyl_correlation']
 
 # Use a suitable purple color scale
-fig_corr = px.imshow(correlation_matrix, text_auto=True, aspect="auto", title="Correlation Matrix for Vinyl Releases",
-                     color_continuous_scale=px.colors.sequential.Purples)
-st.plotly_chart(fig_corr)
+cached_plotly_chart("vinyl_correlation", version, lambda: px.imshow(
+    correlation_matrix, text_auto=True, aspect="auto", title="Correlation Matrix for Vinyl Releases",
+    color_continuous_scale=px.colors.sequential.Purples))
 
 # Analysis
 st.subheader("Correlation Matrix Analysis")
@@ -238,6 +231,16 @@ The correlation matrix reveals several interesting insights:
 """)
 
 st.markdown("<br>", unsafe_allow_html=True)
+
+
+# Every vinyl release, binned into a density grid on the server (see utils/density.py)
+st.header("Have, Want and Price of Every Vinyl Release")
+scatter_tab = lazy_tabs(["Have vs. Want", "Median Price vs. Want"], key="vinyl_scatter_tab")
+x_column = 'have' if scatter_tab == "Have vs. Want" else 'median price_(USD)'
+x, y = load_vinyl_points('discogs_90s', x_column, 'want', selection)
+density_scatter(x, y, key=f"vinyl_scatter_{x_column}", version=version, title=scatter_tab,
+                x_label="Have" if x_column == 'have' else "Median Price (USD)", y_label="Want")
+
 st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("<br>", unsafe_allow_html=True)
 
@@ -247,7 +250,7 @@ st.markdown("<br>", unsafe_allow_html=True)
 col1, col2 = st.columns(2)
 
 with col1:
-    st.image("cheapest_release.jpg", caption="Cheapest Record")
+    responsive_image("cheapest_release.jpg", caption="Cheapest Record")
     st.markdown("""
     **Artist**: Pick-4  
     **Title**: Think (Just A Little Bit)  
@@ -256,10 +259,12 @@ with col1:
     """)
 
 with col2:
-    st.image("mostExpensive.jpg", caption="Most Expensive Record")
+    responsive_image("mostExpensive.jpg", caption="Most Expensive Record")
     st.markdown("""
     **Artist**: Jaco  
     **Title**: Show Some Love  
     **Label**: Warp Records, UK            
     **Highest_price_(USD)**: 550.0$            
-    """)
\ No newline at end of file
+    """)
+
+debug_panel()
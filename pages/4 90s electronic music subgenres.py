@@ -1,90 +1,101 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-import networkx as nx
-import matplotlib.pyplot as plt
 
-df_dc_electr_90s = pd.read_csv('./data/discogs_electr_90s_clean.csv')
+from utils.data import dataset_version, load_discogs_90s, load_style_index
+from utils.explorer import raw_data_explorer
+from utils.figures import cached_plotly_chart
+from utils.graph import load_style_network, network_figure
+from utils.filters import filter_panel, selection_key, selection_mask
+from utils.tracing import debug_panel, span, trace_page
 
+trace_page('styles')
 
-df_dc_electr_90s['styles'] = df_dc_electr_90s['styles'].str.split(',')
-df_dc_electr_90s_exploded = df_dc_electr_90s.explode('styles')
-df_dc_electr_90s_exploded['styles'] = df_dc_electr_90s_exploded['styles'].str.strip()
+df_dc_electr_90s = load_discogs_90s()
+
+# Optional sidebar filters: only the selected releases are counted
+selection = filter_panel('discogs_90s', key='styles_filters')
+mask = selection_mask('discogs_90s', selection)
+version = dataset_version('discogs_90s') + selection_key(selection)
+
+# Integer-coded release -> style index shared by all style analyses,
+# so styles are counted without splitting or exploding strings
+style_index = load_style_index('discogs_90s')
+with span("aggregate:styles"):
+    style_counts_all = style_index.style_counts(mask)
+    styles_by_year_all = style_index.counts_by(df_dc_electr_90s['release_year'], mask).reset_index()
 
 
 st.title('Development of Electronic Music Styles Over Time')
 
 
 if st.checkbox('Show raw data'):
-    st.write(df_dc_electr_90s_exploded)
+    # One row per release (styles comma-joined) instead of the exploded frame
+    raw_data_explorer(df_dc_electr_90s, f"discogs_90s-{dataset_version('discogs_90s')}")
 
 
 st.header('Chronological Development of Styles')
 
 # Group by year and style to count the number of releases per style each year
-styles_by_year = df_dc_electr_90s_exploded.groupby(['release_year', 'styles']).size().reset_index(name='count')
+styles_by_year = styles_by_year_all
 
 
 #Display only the top N most common styles
-top_styles = df_dc_electr_90s_exploded['styles'].value_counts().head(15).index.tolist()
+top_styles = style_counts_all.head(15).index.tolist()
 styles_by_year_top = styles_by_year[styles_by_year['styles'].isin(top_styles)]
 
-fig_top_styles_over_time = px.line(styles_by_year_top, x='release_year', y='count', color='styles',
-                                   title='Development of Top 15 Styles Over Time',
-                                   labels={'release_year': 'Release Year', 'count': 'Number of Releases'},
-                                   markers=True)
-st.plotly_chart(fig_top_styles_over_time)
+cached_plotly_chart("top_styles_over_time", version, lambda: px.line(
+    styles_by_year_top, x='release_year', y='count', color='styles',
+    title='Development of Top 15 Styles Over Time',
+    labels={'release_year': 'Release Year', 'count': 'Number of Releases'},
+    markers=True))
 
 st.header('Tree Map of Electronic Music Subgenres')
 
 # Calculate style counts and filter to top 20
-style_counts = df_dc_electr_90s_exploded['styles'].value_counts().reset_index()
+style_counts = style_counts_all.reset_index()
 style_counts.columns = ['styles', 'count']
 
 # Filter to only include the top 20 styles
 top_20_styles = style_counts.head(40)
 
 # Create the tree map with the top 20 styles
-fig_tree_map = px.treemap(top_20_styles, path=['styles'], values='count',
-                          labels={'count': 'Number of Releases'})
-
-st.plotly_chart(fig_tree_map)
+cached_plotly_chart("styles_tree_map", version, lambda: px.treemap(
+    top_20_styles, path=['styles'], values='count', labels={'count': 'Number of Releases'}))
 
 # Section: Streamgraph of Top 15 Styles Over Time
 st.title('Streamgraph of Top 15 Electronic Music Subgenres in the 90s')
 
 # Identify the top 15 most common styles
-top_15_styles = df_dc_electr_90s_exploded['styles'].value_counts().head(15).index.tolist()
+top_15_styles = style_counts_all.head(15).index.tolist()
+
+# Number of releases per style each year, for only the top 15 styles
+styles_by_year = styles_by_year_all[styles_by_year_all['styles'].isin(top_15_styles)]
+
+def streamgraph_figure():
+    # Create a streamgraph using Plotly Express
+    fig_streamgraph = px.area(
+        styles_by_year,
+        x='release_year',
+        y='count',
+        color='styles',
+        line_group='styles',
+        labels={'release_year': 'Year', 'count': 'Number of Releases'},
+        title='Development of Top 15 Electronic Music Subgenres in the 90s',
+    )
+
+    # Customize the layout for better readability
+    fig_streamgraph.update_layout(
+        xaxis_title='Year',
+        yaxis_title='Number of Releases',
+        showlegend=True,
+        legend_title_text='Styles',
+        hovermode='x unified',
+    )
+    return fig_streamgraph
 
-# Filter the dataset for only the top 15 styles
-filtered_styles = df_dc_electr_90s_exploded[df_dc_electr_90s_exploded['styles'].isin(top_15_styles)]
-
-# Group by year and style to count the number of releases per style each year
-styles_by_year = filtered_styles.groupby(['release_year', 'styles']).size().reset_index(name='count')
-
-# Create a streamgraph using Plotly Express
-fig_streamgraph = px.area(
-    styles_by_year,
-    x='release_year',
-    y='count',
-    color='styles',
-    line_group='styles',
-    labels={'release_year': 'Year', 'count': 'Number of Releases'},
-    title='Development of Top 15 Electronic Music Subgenres in the 90s',
-)
-
-# Customize the layout for better readability
-fig_streamgraph.update_layout(
-    xaxis_title='Year',
-    yaxis_title='Number of Releases',
-    showlegend=True,
-    legend_title_text='Styles',
-    hovermode='x unified',
-)
 
 # Display the streamgraph
-st.plotly_chart(fig_streamgraph)
+cached_plotly_chart("styles_streamgraph", version, streamgraph_figure)
 
 
 
@@ -92,36 +103,48 @@ st.plotly_chart(fig_streamgraph)
 st.title('Sunburst Chart of Top 10 Electronic Music Subgenres in the 90s')
 
 # Identify the top 15 most common styles
-top_10_styles = df_dc_electr_90s_exploded['styles'].value_counts().head(10).index.tolist()
+top_10_styles = style_counts_all.head(10).index.tolist()
 
-# Filter the dataset for only the top 15 styles
-filtered_styles = df_dc_electr_90s_exploded[df_dc_electr_90s_exploded['styles'].isin(top_10_styles)]
+# Number of releases per style each year, for only the top 10 styles
+styles_by_year = styles_by_year_all[styles_by_year_all['styles'].isin(top_10_styles)]
 
-# Group by year and style to count the number of releases per style each year
-styles_by_year = filtered_styles.groupby(['release_year', 'styles']).size().reset_index(name='count')
-
-# Create a sunburst chart using Plotly Express
-fig_sunburst = px.sunburst(
-    styles_by_year,
-    path=['release_year', 'styles'],
-    values='count',
-    color='styles',
-    labels={'release_year': 'Year', 'styles': 'Style', 'count': 'Number of Releases'},
-    title='Sunburst Chart of Top 15 Electronic Music Subgenres in the 90s',
-)
-
-# Customize the layout for better readability
-fig_sunburst.update_layout(
-    margin=dict(t=50, l=25, r=25, b=25)
-)
-
-# Display the sunburst chart
-st.plotly_chart(fig_sunburst)
+def sunburst_figure():
+    # Create a sunburst chart using Plotly Express
+    fig_sunburst = px.sunburst(
+        styles_by_year,
+        path=['release_year', 'styles'],
+        values='count',
+        color='styles',
+        labels={'release_year': 'Year', 'styles': 'Style', 'count': 'Number of Releases'},
+        title='Sunburst Chart of Top 15 Electronic Music Subgenres in the 90s',
+    )
 
+    # Customize the layout for better readability
+    fig_sunburst.update_layout(
+        margin=dict(t=50, l=25, r=25, b=25)
+    )
+    return fig_sunburst
 
 
+# Display the sunburst chart
+cached_plotly_chart("styles_sunburst", version, sunburst_figure)
 
 
+# Section: Network of styles that appear together on the same releases
+st.title('Which Styles Appear Together?')
+st.markdown("""
+Styles are linked when they are often listed on the same release: the overlap is the share of releases
+carrying either style that carry both. Larger circles are more common styles, thicker lines larger overlaps.
+""")
 
+col1, col2 = st.columns(2)
+network_size = col1.slider('Number of styles', 10, 80, 30, step=5, key='network_size')
+min_overlap = col2.slider('Minimum overlap', 0.0, 0.5, 0.05, step=0.01, key='network_overlap')
 
+# Counted as a sparse matrix product and laid out once per version and setting (see utils/graph.py)
+nodes, edges = load_style_network('discogs_90s', selection, network_size, min_overlap)
+cached_plotly_chart("styles_network", version, lambda size, overlap: network_figure(
+    nodes, edges, title=f'Co-occurrence of the Top {len(nodes)} Styles ({len(edges)} links)'),
+    size=network_size, overlap=min_overlap)
 
+debug_panel()
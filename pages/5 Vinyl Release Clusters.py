@@ -0,0 +1,60 @@
+import plotly.express as px
+import streamlit as st
+
+from utils.clustering import load_model, load_segments
+from utils.data import dataset_version
+from utils.figures import cached_plotly_chart
+from utils.filters import filter_panel, selection_key
+from utils.tracing import debug_panel, trace_page
+
+st.set_page_config(layout="wide")
+trace_page('clusters')
+
+# Optional sidebar filters: the model is fitted on every vinyl release, the views show the selected ones
+selection = filter_panel('discogs_90s', key='cluster_filters')
+
+st.title("Segments of 90s Electronic Vinyl Releases")
+st.markdown("""
+Vinyl releases are grouped by how often they are owned (*have*) and wanted (*want*), how many ratings
+they have, their median price and their mean rating. Counts and prices are compared on a log scale,
+so a segment is defined by orders of magnitude rather than by a handful of very popular records.
+""")
+
+n_clusters = st.slider("Number of segments", 2, 8, 4, key="n_clusters")
+
+# Fitted once per dataset version and number of segments, summarised once per selection (see utils/clustering.py)
+model = load_model('discogs_90s', n_clusters)
+segments = load_segments('discogs_90s', n_clusters, selection)
+version = f"{dataset_version('discogs_90s')}{selection_key(selection)}-k{n_clusters}"
+segment_order = [str(i) for i in range(n_clusters)]
+
+sizes = segments['sizes'].rename(index=str)
+profile = segments['profile'].rename(index=str)
+centers = model.centers()
+centers.index = centers.index.astype(str)
+
+st.header("Segment Sizes")
+cached_plotly_chart("cluster_sizes", version, lambda: px.bar(
+    sizes, x=sizes.index, y='releases', color=sizes.index, title="Vinyl Releases per Segment",
+    labels={'segment': 'Segment', 'releases': 'Number of Releases'}))
+
+st.header("What Sets the Segments Apart")
+st.markdown("Median of every feature per segment; colours compare each feature across segments.")
+# Colour by the feature's rank across segments, label with the actual medians
+cached_plotly_chart("cluster_profile", version, lambda: px.imshow(
+    profile.rank(pct=True).T, text_auto=False, aspect="auto", color_continuous_scale=px.colors.sequential.Purples,
+    title="Median Feature Values per Segment", labels={'x': 'Segment', 'y': 'Feature', 'color': 'Rank'},
+).update_traces(text=profile.T.round(2).to_numpy(), texttemplate="%{text}"))
+
+st.dataframe(centers.round(2).rename_axis('segment centre'), use_container_width=True)
+
+st.header("Have vs. Want by Segment")
+sample = segments['sample']
+cached_plotly_chart("cluster_scatter", version, lambda: px.scatter(
+    sample.assign(segment=sample['segment'].astype(str)), x='have', y='want', color='segment',
+    log_x=True, log_y=True, opacity=0.6, hover_data=['num_ratings', 'median price_(USD)', 'mean_rating'],
+    title=f"Have vs. Want ({len(sample):,} of {segments['releases']:,} releases)",
+    labels={'have': 'Have', 'want': 'Want', 'segment': 'Segment'},
+    category_orders={'segment': segment_order}))
+
+debug_panel()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from utils import data, fetch
+
+CONTENT = b"artist,title\nA,B\n"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache = tmp_path / 'cache'
+    monkeypatch.setattr(fetch, 'CACHE_DIR', cache)
+    monkeypatch.delenv('DATASETS_OFFLINE', raising=False)
+    return cache
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    # Local directory standing in for the remote
+    directory = tmp_path / 'mirror'
+    directory.mkdir()
+    (directory / 'releases.csv').write_bytes(CONTENT)
+    return directory
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    urls = []
+    download = fetch._download
+
+    def counting(url, output):
+        urls.append(url)
+        download(url, output)
+
+    monkeypatch.setattr(fetch, '_download', counting)
+    return urls
+
+
+def test_fetch_stores_by_content_hash(cache_dir, mirror, downloads):
+    url = (mirror / 'releases.csv').as_uri()
+    path = fetch.fetch_dataset('releases', url, sha256=SHA256)
+    assert path == cache_dir / 'blobs' / SHA256
+    assert path.read_bytes() == CONTENT
+    manifest = json.loads((cache_dir / 'releases.json').read_text())
+    assert manifest['url'] == url and manifest['sha256'] == SHA256
+    # The second call is served from the cache
+    assert fetch.fetch_dataset('releases', url, sha256=SHA256) == path
+    assert downloads == [url]
+    assert not list(cache_dir.glob('*.part')) and not (cache_dir / 'releases.lock').exists()
+
+
+def test_fetch_plain_path(cache_dir, mirror):
+    path = fetch.fetch_dataset('releases', str(mirror / 'releases.csv'))
+    assert path.name == SHA256
+
+
+def test_checksum_mismatch(cache_dir, mirror):
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        fetch.fetch_dataset('releases', (mirror / 'releases.csv').as_uri(), sha256='0' * 64)
+    assert fetch.cached_path('releases') is None
+    assert not list(cache_dir.rglob('*.part')) and not list((cache_dir / 'blobs').glob('*'))
+
+
+def test_offline_serves_local_copy(cache_dir, mirror, downloads, monkeypatch):
+    monkeypatch.setenv('DATASETS_OFFLINE', '1')
+    local_copy = mirror / 'releases.csv'
+    assert fetch.fetch_dataset('releases', 'https://example.invalid/x', local_copy=local_copy) == local_copy
+    with pytest.raises(FileNotFoundError):
+        fetch.fetch_dataset('releases', 'https://example.invalid/x', local_copy=mirror / 'missing.csv')
+    assert downloads == []
+
+
+def test_offline_serves_cached_copy(cache_dir, mirror, downloads):
+    path = fetch.fetch_dataset('releases', (mirror / 'releases.csv').as_uri())
+    # Even if the expected checksum moved on, offline mode keeps what is cached
+    assert fetch.fetch_dataset('releases', 'https://example.invalid/x', sha256='0' * 64, offline=True) == path
+    assert len(downloads) == 1
+
+
+def test_dataset_path_uses_mirror(cache_dir, mirror, monkeypatch, tmp_path):
+    monkeypatch.setenv('DATASETS_MIRROR', str(mirror))
+    monkeypatch.setitem(data.DATASETS, 'releases', {
+        'url': 'https://example.invalid/releases', 'sha256': SHA256, 'path': tmp_path / 'releases.csv',
+        'dtype': {}, 'categories': [],
+    })
+    assert not data.is_available('releases')
+    path = data.dataset_path('releases')
+    assert path.read_bytes() == CONTENT
+    assert data.is_available('releases')
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    lock = tmp_path / 'x.lock'
+    with fetch.file_lock(lock):
+        assert lock.read_text() == str(os.getpid())
+        with pytest.raises(TimeoutError):
+            with fetch.file_lock(lock, timeout=0.2, poll_interval=0.05):
+                pass
+    assert not lock.exists()
+
+
+def test_file_lock_takes_over_stale_lock(tmp_path):
+    lock = tmp_path / 'x.lock'
+    lock.write_text('12345')
+    old = time.time() - 120
+    os.utime(lock, (old, old))
+    with fetch.file_lock(lock, timeout=1, stale_after=60):
+        assert lock.read_text() == str(os.getpid())
+
+
+def test_file_lock_held_longer_than_stale_after(tmp_path):
+    # The holder keeps touching its lock, so a long download isn't taken for a dead one
+    lock = tmp_path / 'x.lock'
+    with fetch.file_lock(lock, stale_after=0.4):
+        time.sleep(1)
+        with pytest.raises(TimeoutError):
+            with fetch.file_lock(lock, timeout=0.6, poll_interval=0.05, stale_after=0.4):
+                pass
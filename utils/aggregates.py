@@ -0,0 +1,335 @@
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import (SNAPSHOT_DIR, dataset_path, dataset_version, delta_partitions, is_available,
+                        load_dataset, load_style_index, read_delta, snapshot_path, source_version)
+from utils.engine import finalize, iter_batches, iter_selected, merge_partials, scan_partials
+from utils.filters import selection_mask
+from utils.sketches import QuantileSketch
+from utils.snapshots import read_mapped_pickle, write_mapped_pickle
+from utils.styles import StyleIndex
+from utils.tracing import cache_lookup, cache_miss, span
+
+VINYL_MEAN_COLUMNS = ['have', 'want', 'median price_(USD)']
+CORRELATION_COLUMNS = ['have', 'want', 'lowest_price_(USD)', 'median price_(USD)', 'highest_price_(USD)',
+                       'mean_rating', 'num_ratings', 'release_year']
+DISTRIBUTION_COLUMNS = ['have', 'want', 'lowest_price_(USD)', 'median price_(USD)', 'highest_price_(USD)',
+                        'mean_rating']
+# Count tables of the page 3 state, merged by adding them
+COUNT_TABLES = ['format_counts', 'label_format', 'country_format', 'style_format', 'year_format']
+VINYL_COLUMNS = list(dict.fromkeys(VINYL_MEAN_COLUMNS + CORRELATION_COLUMNS + DISTRIBUTION_COLUMNS))
+
+# AGGREGATE_SKETCHES=1 trades the exact page 2 rankings and distinct counts
+# for bounded-memory sketches with reported error bounds (see utils/sketches.py)
+SKETCHES = os.environ.get('AGGREGATE_SKETCHES') == '1'
+# Layout of the stored tables and state; cubes stored with another layout are rebuilt
+CUBE_FORMAT = 2
+
+
+def cube_path(name):
+    # Sketched cubes are stored apart, so switching modes does not discard the exact one
+    suffix = '_sketch' if SKETCHES and CUBES[name].get('sketches') else ''
+    return SNAPSHOT_DIR / f"{name}{suffix}_cube.pkl"
+
+
+def _add(a, b):
+    """Sum two count tables (Series or DataFrames), aligning their labels."""
+    # fill_value only covers cells missing on one side, not new rows x new columns
+    return a.add(b, fill_value=0).fillna(0).astype('int64')
+
+
+def _codes(values):
+    # Codes of the sorted distinct values; categoricals reuse their codes, no strings are compared
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, pd.Index(np.asarray(uniques), name=values.name)
+
+
+def _value_counts(values):
+    """Number of rows per observed value, sorted by value."""
+    codes, uniques = _codes(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return pd.Series(counts, index=uniques, name='count')[counts > 0]
+
+
+def _crosstab(index, columns):
+    """The table pd.crosstab(index, columns) gives, counted with a bincount over value codes."""
+    row_codes, rows = _codes(index)
+    column_codes, columns = _codes(columns)
+    keep = (row_codes >= 0) & (column_codes >= 0)
+    counts = np.bincount(row_codes[keep] * len(columns) + column_codes[keep], minlength=len(rows) * len(columns))
+    table = pd.DataFrame(counts.reshape(len(rows), len(columns)), index=rows, columns=columns)
+    # Like crosstab, only values that occur in some pair
+    return table.loc[table.any(axis=1), table.any()]
+
+
+def _comoments(frame):
+    """Pairwise sums for correlations: per pair of columns, over the rows where both are present.
+
+    n[i, j] rows, sx[i, j] = sum of column i and sxx[i, j] = sum of its
+    squares (over those rows), sxy[i, j] = sum of the products. Sums of
+    batches add up to the sums of all their rows.
+    """
+    present = frame.notna().to_numpy(dtype='float64')
+    values = frame.to_numpy(dtype='float64', na_value=np.nan)
+    values = np.where(present > 0, values, 0)
+    return {
+        'n': present.T @ present,
+        'sx': values.T @ present,
+        'sxx': (values ** 2).T @ present,
+        'sxy': values.T @ values,
+    }
+
+
+def _correlation(moments, columns):
+    """Pearson correlations (pairwise-complete, as DataFrame.corr) from `_comoments`."""
+    n, sx, sxx, sxy = moments['n'], moments['sx'], moments['sxx'], moments['sxy']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = n * sxy - sx * sx.T
+        variance = (n * sxx - sx ** 2) * (n * sxx - sx ** 2).T
+        corr = np.clip(covariance / np.sqrt(variance), -1, 1)
+    corr[(n < 2) | ~(variance > 0)] = np.nan
+    return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+def discogs_90s_partial(df, style_index):
+    """Mergeable state of the page 3 aggregates for some of the 90s releases.
+
+    Every part has a fixed size whatever the number of releases: counts,
+    per-year sums, co-moment sums and quantile sketches of the vinyl columns.
+    """
+    formats = df['format']
+    vinyl = df.loc[df['format'] == 'Vinyl', VINYL_COLUMNS]
+    by_year = vinyl.groupby('release_year')[VINYL_MEAN_COLUMNS]
+    return {
+        'format_counts': _value_counts(formats),
+        'label_format': _crosstab(df['label'], formats),
+        'country_format': _crosstab(df['country'], formats),
+        'style_format': style_index.counts_by(formats),
+        'year_format': _crosstab(df['release_year'], formats),
+        'vinyl_year_sums': by_year.sum().astype('float64'),
+        'vinyl_year_counts': by_year.count().astype('int64'),
+        'vinyl_moments': _comoments(vinyl[CORRELATION_COLUMNS]),
+        'vinyl_sketches': {col: QuantileSketch.from_values(vinyl[col]) for col in DISTRIBUTION_COLUMNS},
+    }
+
+
+def merge_discogs_90s(total, part):
+    merged = {key: _add(total[key], part[key]) for key in COUNT_TABLES}
+    merged['vinyl_year_sums'] = total['vinyl_year_sums'].add(part['vinyl_year_sums'], fill_value=0)
+    merged['vinyl_year_counts'] = _add(total['vinyl_year_counts'], part['vinyl_year_counts'])
+    merged['vinyl_moments'] = {key: total['vinyl_moments'][key] + part['vinyl_moments'][key]
+                               for key in total['vinyl_moments']}
+    merged['vinyl_sketches'] = {col: total['vinyl_sketches'][col].merge(part['vinyl_sketches'][col])
+                                for col in DISTRIBUTION_COLUMNS}
+    return merged
+
+
+def finalize_discogs_90s(total):
+    """Every aggregate page 3 shows, from the merged state."""
+    counts = total['vinyl_year_counts']
+    means = total['vinyl_year_sums'].div(counts.where(counts > 0))
+    return {
+        'format_counts': total['format_counts'].sort_values(ascending=False, kind='stable'),
+        'label_format': total['label_format'],
+        'country_format': total['country_format'],
+        'style_format': total['style_format'].unstack('format', fill_value=0),
+        'year_format': total['year_format'],
+        'vinyl_means': means.sort_index(),
+        'vinyl_correlation': _correlation(total['vinyl_moments'], CORRELATION_COLUMNS),
+        'vinyl_histograms': {col: sketch.summary() for col, sketch in total['vinyl_sketches'].items()},
+    }
+
+
+def build_discogs_90s_cube(df, style_index):
+    """Every aggregate page 3 shows, computed in one pass over the 90s releases."""
+    return finalize_discogs_90s(discogs_90s_partial(df, style_index))
+
+
+def _discogs_90s_base(name):
+    # The base file only: delta partitions are folded in separately
+    return discogs_90s_partial(load_dataset(name, with_deltas=False), load_style_index(name, with_deltas=False))
+
+
+def _discogs_90s_delta(name, path):
+    df = read_delta(name, path)
+    return discogs_90s_partial(df, StyleIndex.from_strings(df['styles']))
+
+
+def _discogs_base(name):
+    # Scanned out-of-core so the catalogue never has to fit in memory
+    return scan_partials(iter_batches(dataset_path(name), snapshot_path(name), source_version(name)),
+                         sketch=SKETCHES)
+
+
+def _discogs_delta(name, path):
+    return scan_partials(iter_batches(path), sketch=SKETCHES)
+
+
+def _discogs_90s_selected(name, mask):
+    # Only the columns the aggregates read are copied
+    columns = ['label', 'country', 'format'] + VINYL_COLUMNS
+    return discogs_90s_partial(load_dataset(name).loc[mask, columns], load_style_index(name).subset(mask))
+
+
+def _discogs_selected(name, mask):
+    # The selected rows are filtered out of the same batch scan as the whole cube, so the
+    # catalogue isn't loaded into memory; the mask covers the base rows, then every partition's
+    batches = chain(iter_batches(dataset_path(name), snapshot_path(name), source_version(name)),
+                    *(iter_batches(path) for path in delta_partitions(name)))
+    return scan_partials(iter_selected(batches, mask), sketch=SKETCHES)
+
+
+# Per dataset: the partial state of its base file, of one delta partition and
+# of a selection of rows, how to merge two states and how to turn a state into
+# the page's tables
+CUBES = {
+    'discogs_90s': {
+        'base': _discogs_90s_base,
+        'delta': _discogs_90s_delta,
+        'selected': _discogs_90s_selected,
+        'merge': merge_discogs_90s,
+        'finalize': finalize_discogs_90s,
+    },
+    'discogs': {
+        'base': _discogs_base,
+        'delta': _discogs_delta,
+        'selected': _discogs_selected,
+        'merge': merge_partials,
+        'finalize': finalize,
+        'sketches': True,
+    },
+}
+
+
+def _write_cube(name, cube):
+    # Arrays are stored out-of-band, so reading a cube maps them instead of copying
+    write_mapped_pickle(cube, cube_path(name))
+
+
+def _fold_deltas(name, state, paths):
+    config = CUBES[name]
+    for path in paths:
+        with span(f"fold_delta:{name}"):
+            state = config['merge'](state, config['delta'](name, path))
+    return state
+
+
+def build_cube(name, version=None):
+    """Compute a dataset's cube from scratch and store it next to its snapshots."""
+    deltas = delta_partitions(name)
+    with span(f"build_cube:{name}"):
+        state = _fold_deltas(name, CUBES[name]['base'](name), deltas)
+        tables = CUBES[name]['finalize'](state)
+    _write_cube(name, {
+        'format': CUBE_FORMAT,
+        'version': version or dataset_version(name),
+        'source_version': source_version(name),
+        'deltas': [path.name for path in deltas],
+        'state': state,
+        'tables': tables,
+    })
+    return tables
+
+
+def _read_stored_cube(name):
+    try:
+        return read_mapped_pickle(cube_path(name))
+    except (FileNotFoundError, EOFError, ValueError):
+        # Missing, or written in an older format: rebuilt by the caller
+        return None
+
+
+def refresh_cube(name, stored=None):
+    """Bring a dataset's stored cube up to date and return its tables.
+
+    When only delta partitions were added since the cube was stored, just
+    those are aggregated and merged into its state; a changed base file (or
+    a cube without state) means a full rebuild.
+    """
+    stored = stored or _read_stored_cube(name)
+    version = dataset_version(name)
+    if stored is not None and stored.get('format') != CUBE_FORMAT:
+        # Stored by an older version of this module: rebuilt below
+        stored = None
+    if stored is not None and stored['version'] == version:
+        return stored['tables']
+    deltas = delta_partitions(name)
+    seen = stored.get('deltas', []) if stored is not None else []
+    if (stored is None or 'state' not in stored or stored.get('source_version') != source_version(name)
+            or [path.name for path in deltas[:len(seen)]] != seen):
+        return build_cube(name, version)
+    with span(f"refresh_cube:{name}"):
+        state = _fold_deltas(name, stored['state'], deltas[len(seen):])
+        tables = CUBES[name]['finalize'](state)
+    _write_cube(name, {**stored, 'version': version, 'deltas': [path.name for path in deltas],
+                       'state': state, 'tables': tables})
+    return tables
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _read_cube(name, version):
+    # Reuse the stored cube when it was built from this version of the data,
+    # and fold in just the new delta partitions when there are some
+    cache_miss()
+    return refresh_cube(name)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _selected_cube(name, version, selection):
+    # Only the selected rows are aggregated, from the in-memory dataset
+    cache_miss()
+    config = CUBES[name]
+    return config['finalize'](config['selected'](name, selection_mask(name, selection)))
+
+
+def load_cube(name, selection=()):
+    """Return the aggregate tables of a dataset, keyed by table name.
+
+    Without a selection (see utils/filters.py) these are the precomputed
+    tables of the whole dataset; otherwise the same tables for the selected
+    rows, computed once per selection.
+    """
+    with span(f"load_cube:{name}"), cache_lookup('cube'):
+        if selection:
+            return _selected_cube(name, dataset_version(name), selection)
+        return _read_cube(name, dataset_version(name))
+
+
+# Formats compared on page 1
+PHYSICAL_FORMATS = ['LP/EP', 'Cassette', 'CD', 'Vinyl Single']
+DIGITAL_FORMATS = ['Download Album', 'Download Single', 'Paid Subscription', 'On-Demand Streaming']
+
+
+def format_sales(df):
+    """Units sold and revenue ('Units' and 'Value' metrics) of the physical and digital formats of page 1."""
+    return df[(df['Format'].isin(PHYSICAL_FORMATS + DIGITAL_FORMATS)) & (df['Metric'].isin(['Units', 'Value']))]
+
+
+def top_by_format(counts, n, formats):
+    """Top `n` rows of a (key x format) count table, restricted to `formats`.
+
+    Rows are ranked on their count over all formats and then ordered by the
+    total over the kept formats, like the stacked bars on page 3.
+    """
+    top_keys = counts.sum(axis=1).sort_values(ascending=False, kind='stable').head(n).index
+    table = counts.loc[top_keys, counts.columns.isin(formats)]
+    # Like a groupby, only keep formats that actually occur in the selection
+    table = table.loc[:, table.any()]
+    return table.loc[table.sum(axis=1).sort_values(ascending=False).index]
+
+
+def build_all_cubes():
+    for name in CUBES:
+        if is_available(name):
+            build_cube(name)
+            print(f"Aggregate cube written for {name}")
+        else:
+            print(f"Skipping {name}: no local copy found")
+
+
+if __name__ == "__main__":
+    build_all_cubes()
@@ -0,0 +1,259 @@
+"""Read-only JSON API over the aggregates the pages show, for other dashboards.
+
+    python -m utils.api --port 8600
+
+    GET /v1/sales/units             units sold per format and year (page 1)
+    GET /v1/sales/revenue           revenue per format and year (page 1)
+    GET /v1/discogs/<table>         catalogue counts, e.g. year_genre_counts (page 2)
+    GET /v1/styles                  releases per style (page 4)
+    GET /v1/styles/by-year          releases per style and year (page 4)
+    GET /                           the list of endpoints
+
+The tables come from the same code as the pages (the stored aggregate cubes,
+the style index and `format_sales`), without the Streamlit runtime. Each
+response is built once per dataset version and kept encoded (identity, gzip
+and, when the `brotli` package is installed, br). Responses carry an ETag
+(a hash of the body, which includes the dataset version) and a
+Last-Modified (the newest file of the dataset), so a consumer
+revalidating with If-None-Match / If-Modified-Since gets a 304 until the
+data changes (e.g. a new delta partition).
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.data import dataset_path, dataset_version, delta_partitions, is_available
+from utils.imports import lazy_import
+from utils.tracing import count_bytes_sent, metrics, span, start_exporters
+
+brotli = lazy_import('brotli') if importlib.util.find_spec('brotli') else None
+
+MIN_COMPRESS_BYTES = 1024
+MAX_AGE = 60
+
+
+def _records(frame):
+    return json.loads(frame.to_json(orient='records'))
+
+
+def sales(metric):
+    from utils.aggregates import format_sales
+    from utils.data import load_music_sales
+
+    df = format_sales(load_music_sales())
+    return {'data': _records(df[df['Metric'] == metric].drop(columns='Metric'))}
+
+
+def discogs_table(table):
+    from utils.aggregates import refresh_cube
+
+    tables = refresh_cube('discogs')
+    if table not in tables:
+        return None
+    # Tables of a sketched cube (AGGREGATE_SKETCHES=1) are approximate, with an error bound
+    fields = {'data': _records(tables[table].reset_index())}
+    if table in tables.get('errors', {}):
+        fields['error'] = tables['errors'][table]
+    return fields
+
+
+def style_counts():
+    from utils.data import load_style_index
+
+    counts = load_style_index('discogs_90s').style_counts()
+    return {'data': _records(counts.rename('count').rename_axis('styles').reset_index())}
+
+
+def styles_by_year():
+    from utils.data import load_dataset, load_style_index
+
+    counts = load_style_index('discogs_90s').counts_by(load_dataset('discogs_90s')['release_year'])
+    return {'data': _records(counts.reset_index())}
+
+
+# path -> (dataset, build); build returns the response's fields, at least 'data' (None: not found)
+ENDPOINTS = {
+    '/v1/sales/units': ('music_sales', lambda: sales('Units')),
+    '/v1/sales/revenue': ('music_sales', lambda: sales('Value')),
+    '/v1/styles': ('discogs_90s', style_counts),
+    '/v1/styles/by-year': ('discogs_90s', styles_by_year),
+}
+DISCOGS_TABLES = ['genre_counts', 'format_counts', 'country_counts', 'electronic_country_counts',
+                  'year_genre_counts', 'year_genre_labels', 'year_styles']
+for _table in DISCOGS_TABLES:
+    ENDPOINTS[f'/v1/discogs/{_table}'] = ('discogs', lambda table=_table: discogs_table(table))
+
+
+def last_modified(name):
+    """When a dataset last changed: its base file or newest delta partition (seconds since the epoch)."""
+    paths = [dataset_path(name), *delta_partitions(name)]
+    return max(int(os.stat(path).st_mtime) for path in paths)
+
+
+class Response:
+    """An encoded JSON response and its validators."""
+
+    def __init__(self, body, version, modified):
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+        self.version = version
+        self.modified = modified
+        self.bodies = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=9)
+
+    def encoding(self, accept_encoding):
+        """The smallest encoding the client accepts."""
+        accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')
+                    if not part.strip().endswith(';q=0')}
+        options = [name for name in self.bodies if name == 'identity' or name in accepted or '*' in accepted]
+        return min(options, key=lambda name: len(self.bodies[name]))
+
+    def not_modified(self, headers):
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match is not None:
+            # The ETag is the same for every encoding (W/ prefixes from proxies are ignored)
+            return self.etag in {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')} \
+                or if_none_match.strip() == '*'
+        if_modified_since = headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+_responses = {}
+# One lock per (path, version) build, so a slow build (e.g. the discogs cube)
+# doesn't hold up requests for other endpoints; _locks_lock only guards the dict
+_build_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get_response(path):
+    """The response of an endpoint for the current version of its dataset, built on first use."""
+    name, build = ENDPOINTS[path]
+    version = dataset_version(name)
+    response = _responses.get(path)
+    if response is not None and response.version == version:
+        return response
+    # Concurrent requests for a new version wait for its build instead of repeating it
+    key = (path, version)
+    with _locks_lock:
+        lock = _build_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            response = _responses.get(path)
+            if response is not None and response.version == version:
+                return response
+            with span(f"api:{path}"):
+                fields = build()
+            if fields is None:
+                return None
+            body = json.dumps({'dataset': name, 'version': version, **fields}, separators=(',', ':')).encode()
+            response = _responses[path] = Response(body, version, last_modified(name))
+            return response
+    finally:
+        # Later requests find the response; the waiting ones still hold the lock object
+        with _locks_lock:
+            if _build_locks.get(key) is lock:
+                del _build_locks[key]
+
+
+def index():
+    return {'endpoints': sorted(path for path, (name, _) in ENDPOINTS.items() if is_available(name))}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        path = self.path.split('?')[0].rstrip('/') or '/'
+        if path == '/':
+            self._send(200, json.dumps(index()).encode(), send_body)
+            return
+        if path not in ENDPOINTS or not is_available(ENDPOINTS[path][0]):
+            self._send(404, b'{"error":"not found"}', send_body, endpoint='unknown')
+            return
+        try:
+            response = get_response(path)
+        except Exception:
+            logging.getLogger(__name__).exception("Building %s failed", path)
+            self._send(500, b'{"error":"internal error"}', send_body, endpoint=path)
+            return
+        if response is None:
+            self._send(404, b'{"error":"not found"}', send_body, endpoint=path)
+            return
+        headers = {
+            'ETag': response.etag,
+            'Last-Modified': formatdate(response.modified, usegmt=True),
+            'Cache-Control': f'public, max-age={MAX_AGE}',
+            'Vary': 'Accept-Encoding',
+        }
+        if response.not_modified(self.headers):
+            self._send(304, b'', False, endpoint=path, headers=headers)
+            return
+        encoding = response.encoding(self.headers.get('Accept-Encoding'))
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        self._send(200, response.bodies[encoding], send_body, endpoint=path, headers=headers)
+
+    def _send(self, status, body, send_body, endpoint='/', headers=None):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+            count_bytes_sent('api', len(body))
+        metrics.inc('app_api_requests_total', endpoint=endpoint, status=status)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the app's aggregates")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--no-warm', action='store_true', help="build each response on its first request")
+    args = parser.parse_args(argv)
+
+    # The loaders are shared with the pages; without a Streamlit session they warn on every call
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    start_exporters()
+    server = ThreadingHTTPServer((args.host, args.port), _ApiHandler)
+    if not args.no_warm:
+        start = time.perf_counter()
+        for path, (name, _) in ENDPOINTS.items():
+            if is_available(name):
+                get_response(path)
+        print(f"Responses built in {time.perf_counter() - start:.1f}s", flush=True)
+    print(f"Serving the API on http://{args.host}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
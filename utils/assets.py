@@ -0,0 +1,165 @@
+"""Resized, compressed variants of the app's images, served as responsive <picture>s.
+
+    python -m utils.assets        # pre-generate the variants of every image
+
+Each image is encoded at a few widths (never wider than the original) as
+WebP, plus a JPEG fallback (a palette PNG when it has transparency). The
+WebP variants are dropped when they aren't all smaller than the fallback,
+as for small palette images like the logo; an empty
+`<name>-<hash>.no-webp` marker records that, so they aren't re-encoded.
+Variants are named after a hash of the source file's content, so they are
+generated once, survive restarts and are never served stale:
+
+    static/assets/<name>-<hash>-<width>.<webp|jpg|png>
+
+`responsive_image` then emits a <picture> with srcsets of them, served by
+Streamlit's static file serving (server.enableStaticServing, on in
+.streamlit/config.toml); the browser downloads the smallest variant that
+fills its layout. Without static serving it falls back to st.image.
+"""
+import hashlib
+import html
+import os
+import sys
+from pathlib import Path
+
+import streamlit as st
+from PIL import Image
+
+from utils.tracing import cache_lookup, cache_miss, span
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# Streamlit serves <main script dir>/static at app/static
+STATIC_DIR = ROOT_DIR / 'static'
+ASSET_DIR = STATIC_DIR / 'assets'
+IMAGES = ['finalProjTitelBild.png', 'Discogs_logo.png', 'discogs_statistics_screenshot.png',
+          'cheapest_release.jpg', 'mostExpensive.jpg']
+WIDTHS = (320, 640, 960, 1400)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def content_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:12]
+
+
+def _has_transparency(image):
+    if image.mode not in ('RGBA', 'LA', 'PA') and 'transparency' not in image.info:
+        return False
+    # An alpha channel that is opaque everywhere doesn't need a PNG
+    return image.convert('RGBA').getchannel('A').getextrema()[0] < 255
+
+
+def _save(image, path, **options):
+    # Per-process temp name: several workers may encode the same variant at once
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    image.save(tmp_path, **options)
+    tmp_path.replace(path)
+
+
+def build_variants(path, widths=WIDTHS):
+    """Write the missing variants of an image; returns its size and variants by format.
+
+    The result is {'width', 'height', 'webp': [(width, file name)], 'fallback':
+    [(width, file name)], 'fallback_type'}, smallest width first; 'webp' is
+    empty when WebP doesn't save anything over the fallback at every width.
+    """
+    path = Path(path)
+    digest = content_hash(path)
+    with Image.open(path) as source:
+        source.load()
+    transparent = _has_transparency(source)
+    image = source.convert('RGBA' if transparent else 'RGB')
+    fallback_ext = 'png' if transparent else 'jpg'
+    # Only downscale; the original width is always one of the variants
+    sizes = sorted({w for w in widths if w < image.width} | {image.width})
+    variants = {'width': image.width, 'height': image.height, 'webp': [], 'fallback': [],
+                'fallback_type': f"image/{'png' if transparent else 'jpeg'}"}
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)
+    no_webp = ASSET_DIR / f"{path.stem}-{digest}.no-webp"
+    kinds = [('fallback', fallback_ext)] + ([] if no_webp.exists() else [('webp', 'webp')])
+    for width in sizes:
+        resized = None
+        for kind, ext in kinds:
+            name = f"{path.stem}-{digest}-{width}.{ext}"
+            target = ASSET_DIR / name
+            if not target.exists():
+                if resized is None:
+                    height = round(image.height * width / image.width)
+                    resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                if ext == 'webp':
+                    _save(resized, target, format='WEBP', quality=WEBP_QUALITY, method=6)
+                elif ext == 'jpg':
+                    _save(resized, target, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                else:
+                    # 256-colour palette (with alpha): a fraction of the size of a truecolour PNG
+                    _save(resized.quantize(256, method=Image.Quantize.FASTOCTREE), target, format='PNG', optimize=True)
+            variants[kind].append((width, name))
+    if any((ASSET_DIR / webp).stat().st_size >= (ASSET_DIR / fallback).stat().st_size
+           for (_, webp), (_, fallback) in zip(variants['webp'], variants['fallback'])):
+        for _, webp in variants['webp']:
+            (ASSET_DIR / webp).unlink(missing_ok=True)
+        variants['webp'] = []
+        no_webp.touch()
+    return variants
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _variants(path, version):
+    # `version` (mtime + size) only keys the cache; files are named by content hash
+    cache_miss()
+    return build_variants(path)
+
+
+def load_variants(path):
+    path = ROOT_DIR / path
+    stat = path.stat()
+    with span(f"image:{path.name}"), cache_lookup('image'):
+        return _variants(str(path), f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def _srcset(entries):
+    return ', '.join(f"app/static/assets/{name} {width}w" for width, name in entries)
+
+
+def responsive_image(path, caption=None, sizes=None):
+    """Show an image (a path relative to the repo) like st.image, as a responsive <picture>.
+
+    `sizes` is the width the image is laid out at (an HTML sizes attribute);
+    by default its original width, or the viewport's if that is narrower.
+    """
+    if not st.get_option('server.enableStaticServing'):
+        st.image(path, caption=caption)
+        return
+    variants = load_variants(path)
+    width, height = variants['width'], variants['height']
+    sizes = sizes or f"(max-width: {width}px) 100vw, {width}px"
+    fallback = variants['fallback'][-1][1]
+    webp_source = (f'<source type="image/webp" srcset="{_srcset(variants["webp"])}" sizes="{sizes}">'
+                   if variants['webp'] else '')
+    caption_html = (f'<figcaption style="font-size: 14px; color: rgba(49, 51, 63, 0.6);">'
+                    f'{html.escape(caption)}</figcaption>') if caption else ''
+    st.markdown(
+        f'<figure style="margin: 0;"><picture>'
+        f'{webp_source}'
+        f'<source type="{variants["fallback_type"]}" srcset="{_srcset(variants["fallback"])}" sizes="{sizes}">'
+        f'<img src="app/static/assets/{fallback}" width="{width}" height="{height}" alt="{html.escape(caption or "")}" '
+        f'style="max-width: 100%; height: auto;" decoding="async">'
+        f'</picture>{caption_html}</figure>',
+        unsafe_allow_html=True,
+    )
+
+
+def main(argv=None):
+    for name in IMAGES:
+        variants = build_variants(ROOT_DIR / name)
+        original = (ROOT_DIR / name).stat().st_size
+        kind = 'webp' if variants['webp'] else 'fallback'
+        sizes = ', '.join(f"{width}w: {(ASSET_DIR / file).stat().st_size / 1024:,.0f} KB"
+                          for width, file in variants[kind])
+        print(f"{name} ({original / 1024:,.0f} KB) -> {kind} {sizes}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""Headless benchmark of the app's pages (Streamlit's AppTest, no browser).
+
+Every page is run in a fresh interpreter, once cold (empty caches) and once
+warm (a rerun in the same process), on the bundled data and on synthetic
+scaled-up copies of it. Reported per page: wall time, peak RSS, the size of
+every figure's JSON and the time spent in each section of the page, i.e.
+between consecutive headings.
+
+    python -m utils.bench                          # bundled data, 10x and 100x
+    python -m utils.bench --scale 1 10 --output bench.json
+    python -m utils.bench --compare bench.json     # print changes against a saved run
+
+The synthetic datasets (with their snapshots and cubes) are written once
+under .cache/bench/x<scale>; pass --regenerate to rebuild them.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = ROOT_DIR / '.cache' / 'bench'
+PAGES = [ROOT_DIR / 'Intro.py'] + sorted((ROOT_DIR / 'pages').glob('*.py'))
+SCALES = [1, 10, 100]
+PAGE_TIMEOUT = 600
+
+PREPARE_SCRIPT = """
+from utils.aggregates import build_all_cubes
+from utils.data import DATASETS, build_all_snapshots, dataset_path
+for name in DATASETS:
+    dataset_path(name)
+build_all_snapshots()
+build_all_cubes()
+"""
+
+DISCOGS_GENRES = ['Electronic', 'Rock', 'Pop', 'Jazz', 'Hip Hop', 'Funk / Soul', 'Classical',
+                  'Folk, World, & Country', 'Latin', 'Reggae', 'Blues', 'Stage & Screen']
+DISCOGS_GENRE_WEIGHTS = np.array([30, 20, 15, 8, 7, 6, 4, 4, 2, 2, 1, 1]) / 100
+DISCOGS_FORMATS = ['Vinyl', 'CD', 'Cassette', 'File', 'CDr', 'DVD']
+
+
+def scale_music_sales(df, scale):
+    # Earlier copies of the series extend the timeline backwards
+    span = df['Year'].max() - df['Year'].min() + 1
+    return pd.concat([df.assign(Year=df['Year'] - i * span) for i in range(scale)], ignore_index=True)
+
+
+def scale_discogs_90s(df, scale, rng):
+    rows = df.iloc[rng.integers(0, len(df), len(df) * scale)].reset_index(drop=True)
+    # Spread the copies over more labels, as a larger catalogue would have
+    copy = np.repeat(np.arange(scale), len(df))
+    rows['label'] = np.where(copy == 0, rows['label'], rows['label'] + ' #' + copy.astype(str))
+    return rows
+
+
+def synthetic_discogs(df_90s, scale, rng):
+    """Catalogue shaped like the full Discogs export, sampled from the 90s releases."""
+    n = len(df_90s) * scale
+    rows = df_90s.iloc[rng.integers(0, len(df_90s), n)].reset_index(drop=True)
+    return pd.DataFrame({
+        'artist': rows['artist'],
+        'title': rows['title'],
+        'label': rows['label'],
+        'country': rows['country'],
+        'format': rng.choice(DISCOGS_FORMATS, n),
+        'genre': rng.choice(DISCOGS_GENRES, n, p=DISCOGS_GENRE_WEIGHTS),
+        'styles': rows['styles'],
+        'release_id': np.arange(n) + 1000,
+        'artist_id': rng.integers(1, 10 ** 6, n),
+        'label_id': rng.integers(1, 10 ** 5, n).astype(float),
+        'release_year': rng.integers(1950, 2024, n),
+    })
+
+
+def scaled_environ(data_dir):
+    """Environment that points the app at the datasets in `data_dir`."""
+    return {
+        'DATASETS_DIR': str(data_dir),
+        'DATASETS_MIRROR': str(data_dir),
+        'DATASETS_CACHE_DIR': str(data_dir / 'cache'),
+    }
+
+
+def make_scaled_data(scale, regenerate=False):
+    """Write the scaled-up datasets, snapshots and cubes for `scale` once."""
+    data_dir = BENCH_DIR / f"x{scale}"
+    done = data_dir / 'complete'
+    if done.exists() and not regenerate:
+        return data_dir
+    data_dir.mkdir(parents=True, exist_ok=True)
+    done.unlink(missing_ok=True)
+    rng = np.random.default_rng(scale)
+    source = ROOT_DIR / 'data'
+    music_sales = pd.read_csv(source / 'music_sales_clean.csv')
+    scale_music_sales(music_sales, scale).to_csv(data_dir / 'music_sales_clean.csv', index=False)
+    df_90s = pd.read_csv(source / 'discogs_electr_90s_clean.csv')
+    scale_discogs_90s(df_90s, scale, rng).to_csv(data_dir / 'discogs_electr_90s_clean.csv', index=False)
+    synthetic_discogs(df_90s, scale, rng).to_csv(data_dir / 'discogs_clean.csv', index=False)
+    # Same preparation as the cleaning notebook (snapshots, then cubes), after
+    # fetching the catalogue from the mirror so that it is available locally
+    env = {**os.environ, **scaled_environ(data_dir), 'PYTHONPATH': str(ROOT_DIR)}
+    subprocess.run([sys.executable, '-c', PREPARE_SCRIPT], cwd=ROOT_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    done.touch()
+    return data_dir
+
+
+def _peak_rss_mb():
+    # VmHWM starts afresh with each program, whereas ru_maxrss survives exec and
+    # would report the parent's peak
+    try:
+        for line in Path('/proc/self/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _record_sections(events):
+    """Time-stamp every element the page sends; headings start a new section."""
+    from streamlit.delta_generator import DeltaGenerator
+
+    enqueue = DeltaGenerator._enqueue
+
+    def timed_enqueue(self, delta_type, element_proto, *args, **kwargs):
+        events.append((time.perf_counter(), delta_type, getattr(element_proto, 'body', '')))
+        return enqueue(self, delta_type, element_proto, *args, **kwargs)
+
+    DeltaGenerator._enqueue = timed_enqueue
+
+
+def _sections(events, start, end):
+    sections = []
+    name, since = '(setup)', start
+    for t, delta_type, body in events:
+        if delta_type == 'heading':
+            sections.append({'name': name, 'seconds': round(t - since, 4)})
+            name, since = body, t
+    sections.append({'name': name, 'seconds': round(end - since, 4)})
+    return sections
+
+
+def _run_once(page, events):
+    from streamlit.testing.v1 import AppTest
+
+    events.clear()
+    at = AppTest.from_file(str(page), default_timeout=PAGE_TIMEOUT)
+    start = time.perf_counter()
+    at.run()
+    end = time.perf_counter()
+    figures = []
+    for chart in at.get('plotly_chart'):
+        spec = chart.proto.spec
+        title = json.loads(spec).get('layout', {}).get('title', {})
+        figures.append({'title': title.get('text', '') if isinstance(title, dict) else str(title),
+                        'bytes': len(spec.encode())})
+    return {
+        'seconds': round(end - start, 4),
+        'exceptions': [e.value for e in at.exception],
+        'figures': figures,
+        'figure_bytes': sum(f['bytes'] for f in figures),
+        'sections': _sections(events, start, end),
+    }
+
+
+def run_page(page):
+    """Benchmark one page in this process (meant to run in a fresh interpreter)."""
+    events = []
+    _record_sections(events)
+    rss_before = _peak_rss_mb()
+    cold = _run_once(page, events)
+    peak_cold = _peak_rss_mb()
+    warm = _run_once(page, events)
+    return {
+        'cold': cold,
+        'warm': warm,
+        'baseline_rss_mb': round(rss_before, 1),
+        'peak_rss_mb': round(peak_cold, 1),
+        'peak_rss_warm_mb': round(_peak_rss_mb(), 1),
+    }
+
+
+def bench_page(page, env):
+    result = subprocess.run(
+        [sys.executable, '-m', 'utils.bench', '--child', str(page)],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+        env={**os.environ, **env, 'PYTHONPATH': str(ROOT_DIR)},
+    )
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench(scales=SCALES, pages=PAGES, regenerate=False):
+    results = {}
+    for scale in scales:
+        if scale == 1:
+            # The bundled data as-is; datasets that would need a download are reported as errors
+            env = {'DATASETS_OFFLINE': '1'}
+        else:
+            env = scaled_environ(make_scaled_data(scale, regenerate))
+        results[f"x{scale}"] = {Path(page).name: bench_page(page, env) for page in pages}
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    def delta(value, old):
+        return f" ({value - old:+.2f})" if old is not None else ""
+
+    for scale, pages in report['results'].items():
+        print(f"== {scale}")
+        for page, r in pages.items():
+            if 'error' in r:
+                print(f"{page}: ERROR {r['error']}")
+                continue
+            old = (baseline or {}).get('results', {}).get(scale, {}).get(page, {})
+            old_cold = old.get('cold', {}).get('seconds')
+            old_warm = old.get('warm', {}).get('seconds')
+            old_rss = old.get('peak_rss_mb')
+            print(f"{page}: cold {r['cold']['seconds']:.2f}s{delta(r['cold']['seconds'], old_cold)}, "
+                  f"warm {r['warm']['seconds']:.2f}s{delta(r['warm']['seconds'], old_warm)}, "
+                  f"peak RSS {r['peak_rss_mb']:.0f} MB{delta(r['peak_rss_mb'], old_rss)}, "
+                  f"{len(r['cold']['figures'])} figures / {r['cold']['figure_bytes'] / 1024:.0f} KiB")
+            for error in r['cold']['exceptions']:
+                print(f"    exception: {error}")
+            slowest = sorted(r['cold']['sections'], key=lambda s: -s['seconds'])[:3]
+            print("    slowest sections: " + ', '.join(f"{s['name'][:40]} {s['seconds']:.2f}s" for s in slowest))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless page benchmark")
+    parser.add_argument('pages', nargs='*', help="page scripts (default: Intro.py and pages/*.py)")
+    parser.add_argument('--scale', type=int, nargs='+', default=SCALES, help="data scale factors (1 = bundled data)")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="previous JSON results to compare against")
+    parser.add_argument('--regenerate', action='store_true', help="rebuild the synthetic datasets")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_page(args.child)))
+        return 0
+    report = bench(args.scale, args.pages or PAGES, args.regenerate)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+def binned_histogram(summary, title=None, label=None, color=None):
+    """Histogram with a marginal box plot, drawn from a pre-aggregated summary.
+
+    `summary` is what `QuantileSketch.summary` returns: bin 'edges' and
+    'counts', the value 'count', and the box statistics 'q1', 'median', 'q3',
+    'lowerfence', 'upperfence' and 'mean' (only 'edges', 'counts' and 'count'
+    when there are no values). Its size is fixed whatever the number of
+    values, so only it (and not the raw rows) is sent to the browser.
+    """
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.26, 0.74], vertical_spacing=0.01)
+    edges = np.asarray(summary['edges'])
+    if len(edges):
+        fig.add_trace(go.Box(
+            q1=[summary['q1']], median=[summary['median']], q3=[summary['q3']],
+            lowerfence=[summary['lowerfence']], upperfence=[summary['upperfence']],
+            mean=[summary['mean']], y=[label], orientation='h',
+            marker_color=color, name=label, showlegend=False, hoverinfo='x',
+        ), row=1, col=1)
+        fig.add_trace(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2, y=summary['counts'], width=np.diff(edges),
+            marker_color=color, name=label, showlegend=False,
+            customdata=np.column_stack([edges[:-1], edges[1:]]),
+            hovertemplate=f"{label}=%{{customdata[0]:.4g}} - %{{customdata[1]:.4g}}<br>count=%{{y}}<extra></extra>",
+        ), row=2, col=1)
+    fig.update_yaxes(visible=False, row=1, col=1)
+    fig.update_xaxes(title_text=label, row=2, col=1)
+    fig.update_yaxes(title_text='count', row=2, col=1)
+    fig.update_layout(title=title, bargap=0)
+    return fig
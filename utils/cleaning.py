@@ -0,0 +1,173 @@
+"""Rebuild the cleaned datasets from the raw dumps (replaces 1_data_cleaning.ipynb).
+
+    python -m utils.cleaning                       # every raw file found in data/
+    python -m utils.cleaning discogs_90s --workers 8 --chunksize 500000
+    python -m utils.cleaning --raw-dir dumps/ --out-dir data/ --no-snapshots
+
+Raw CSVs are read in chunks of strings and each chunk is cleaned with
+vectorised string ops in a process pool, so no per-row Python runs. The
+cleaned chunks are cast to the dtypes the app reads them with, sorted
+(stably, so reruns give identical files) and written once, atomically.
+Afterwards the snapshots and aggregate cubes are rebuilt, as the notebook's
+last cell did.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils.data import DATA_DIR, DISCOGS_90S_DTYPES, DISCOGS_DTYPES, MUSIC_SALES_DTYPES
+
+CHUNKSIZE = 200_000
+MIN_YEAR = 1950
+
+PRICE_COLUMNS = {
+    'lowest_price': 'lowest_price_(USD)',
+    'median_price': 'median price_(USD)',
+    'highest_price': 'highest_price_(USD)',
+}
+DISCOGS_DROP_COLUMNS = ['notes', 'video_url', 'company_name', 'status', 'id', 'master_id']
+DISCOGS_RENAME = {'artist_name': 'artist', 'label_name': 'label', 'style': 'styles'}
+
+
+def parse_prices(values):
+    """'$12.50' -> 12.5 and '--' (no price) -> NaN, for a whole column at once."""
+    values = values.where(values != '--')
+    return pd.to_numeric(values.str.replace('$', '', regex=False).str.replace(',', '', regex=False))
+
+
+def clean_discogs_electronic(chunk):
+    """Numeric prices, rating and year for the 90s electronic scrape, complete rows only.
+
+    As in the notebook, rows are not filtered by year or genre: the scrape
+    already is the 90s electronic catalogue (a few releases are dated 2000
+    or tagged Hip Hop or Funk / Soul, and are kept).
+    """
+    for raw, clean in PRICE_COLUMNS.items():
+        chunk[clean] = parse_prices(chunk[raw])
+    chunk['mean_rating'] = pd.to_numeric(chunk['average_rating'].where(chunk['average_rating'] != '--'))
+    # release_date is 'YYYY-MM-DD' (or just the year)
+    chunk['release_year'] = pd.to_numeric(chunk['release_date'].str[:4])
+    chunk = chunk.drop(columns=['release_date', 'average_rating', *PRICE_COLUMNS])
+    return chunk.dropna()
+
+
+def clean_discogs(chunk):
+    """Full catalogue: complete rows released from 1950 on, with the app's column names."""
+    chunk = chunk.drop(columns=DISCOGS_DROP_COLUMNS).dropna()
+    chunk['release_year'] = pd.to_numeric(chunk['release_date'])
+    chunk = chunk.drop(columns=['release_date'])
+    chunk = chunk[chunk['release_year'] >= MIN_YEAR]
+    return chunk.rename(columns=DISCOGS_RENAME)
+
+
+def clean_music_sales(chunk):
+    # Rows missing any field (the record count included) are dropped, as before
+    return chunk.dropna().drop(columns=['index', 'Number of Records'])
+
+
+PIPELINES = {
+    'discogs_90s': {
+        'raw': 'discogs_electronic.csv',
+        'output': 'discogs_electr_90s_clean.csv',
+        'clean': clean_discogs_electronic,
+        'dtype': DISCOGS_90S_DTYPES,
+        'sort': 'release_year',
+    },
+    'discogs': {
+        'raw': 'discogs.csv',
+        'output': 'discogs_clean.csv',
+        'clean': clean_discogs,
+        'dtype': DISCOGS_DTYPES,
+        'sort': 'release_year',
+    },
+    'music_sales': {
+        'raw': 'MusicData.csv',
+        'output': 'music_sales_clean.csv',
+        'clean': clean_music_sales,
+        'dtype': MUSIC_SALES_DTYPES,
+        'sort': 'Year',
+    },
+}
+
+
+def clean_chunk(name, chunk):
+    """Clean one chunk and cast it to the output dtypes (runs in a worker process)."""
+    config = PIPELINES[name]
+    chunk = config['clean'](chunk)
+    # Fixed column order and dtypes, whatever a chunk happened to contain
+    return chunk[list(config['dtype'])].astype(config['dtype'])
+
+
+def clean_dataset(name, raw_path, out_path, workers=None, chunksize=CHUNKSIZE, max_pending=None):
+    """Clean `raw_path` into `out_path`; returns the number of rows written."""
+    config = PIPELINES[name]
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    # Everything is read as strings and converted explicitly, so the result
+    # doesn't depend on what pandas would infer for each chunk
+    reader = pd.read_csv(raw_path, dtype=str, chunksize=chunksize)
+    parts = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for chunk in reader:
+            pending.append(pool.submit(clean_chunk, name, chunk))
+            # Bound the raw chunks held in memory while the workers catch up
+            if len(pending) >= max_pending:
+                parts.append(pending.pop(0).result())
+        parts.extend(future.result() for future in pending)
+
+    # Parts are in input order and the sort is stable, so ties keep their input order
+    if not parts:
+        parts = [clean_chunk(name, pd.read_csv(raw_path, dtype=str, nrows=0))]
+    df = pd.concat(parts, ignore_index=True)
+    df = df.sort_values(config['sort'], kind='stable')
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix('.csv.tmp')
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the raw Discogs and music sales dumps")
+    parser.add_argument('datasets', nargs='*', metavar='dataset',
+                        help=f"datasets to rebuild ({', '.join(PIPELINES)}; default: those with a raw file)")
+    parser.add_argument('--raw-dir', type=Path, default=DATA_DIR, help="directory of the raw CSVs")
+    parser.add_argument('--out-dir', type=Path, default=DATA_DIR, help="directory for the cleaned CSVs")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="rows per chunk")
+    parser.add_argument('--no-snapshots', action='store_true', help="skip rebuilding snapshots and cubes")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in PIPELINES]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+
+    names = args.datasets or [name for name, config in PIPELINES.items()
+                              if (args.raw_dir / config['raw']).exists()]
+    if not names:
+        print(f"No raw files found in {args.raw_dir}")
+        return 1
+    for name in names:
+        config = PIPELINES[name]
+        start = time.perf_counter()
+        rows = clean_dataset(name, args.raw_dir / config['raw'], args.out_dir / config['output'],
+                             workers=args.workers, chunksize=args.chunksize)
+        print(f"{name}: {rows:,} rows -> {args.out_dir / config['output']} ({time.perf_counter() - start:.1f}s)")
+
+    if not args.no_snapshots:
+        from utils.aggregates import build_all_cubes
+        from utils.data import build_all_snapshots
+
+        build_all_snapshots()
+        build_all_cubes()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
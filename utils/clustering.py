@@ -0,0 +1,192 @@
+"""Segments of vinyl releases, fitted incrementally and stored per dataset version.
+
+Releases are clustered on how collected, wanted, rated and priced they are.
+The model is fitted without holding the features of every release at
+once: the scaler and a mini-batch KMeans are updated chunk by chunk over the
+(memory-mapped) dataset, for a few passes. The fitted model is pickled next
+to the snapshots, keyed by dataset version and parameters, so it is fitted
+once per version rather than per process or rerun; assigning every release
+to its nearest centre is then one vectorised predict.
+"""
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import SNAPSHOT_DIR, dataset_version, load_dataset
+from utils.filters import selection_mask
+from utils.imports import lazy_import
+from utils.tracing import cache_lookup, cache_miss, span
+
+# Only needed to fit (or unpickle) a model
+sk_cluster = lazy_import('sklearn.cluster')
+sk_preprocessing = lazy_import('sklearn.preprocessing')
+
+CLUSTER_FEATURES = ['have', 'want', 'num_ratings', 'median price_(USD)', 'mean_rating']
+# Heavily skewed counts and prices are clustered on a log scale
+LOG_FEATURES = ['have', 'want', 'num_ratings', 'median price_(USD)']
+CHUNK_ROWS = 1 << 16
+EPOCHS = 3
+BATCH_SIZE = 4096
+SEED = 0
+SAMPLE_POINTS = 5000
+
+
+def vinyl_rows(df):
+    """Row numbers of the vinyl releases with every clustering feature present."""
+    mask = (df['format'] == 'Vinyl').to_numpy() & df[CLUSTER_FEATURES].notna().all(axis=1).to_numpy()
+    return np.flatnonzero(mask)
+
+
+class ClusterModel:
+    """Scaler and KMeans centres over `CLUSTER_FEATURES`."""
+
+    def __init__(self, scaler, kmeans):
+        self.scaler = scaler
+        self.kmeans = kmeans
+
+    @staticmethod
+    def features(df):
+        """Feature matrix of the rows of `df`, log-transformed where skewed."""
+        X = df[CLUSTER_FEATURES].to_numpy(dtype='float64')
+        log_columns = [CLUSTER_FEATURES.index(col) for col in LOG_FEATURES]
+        X[:, log_columns] = np.log1p(np.maximum(X[:, log_columns], 0))
+        return X
+
+    @classmethod
+    def fit(cls, chunks, n_clusters, epochs=EPOCHS):
+        """Fit on an iterable factory of feature frames, one chunk at a time.
+
+        `chunks()` is called once per pass, so the data never has to be in
+        memory as a whole.
+        """
+        scaler = sk_preprocessing.StandardScaler()
+        for chunk in chunks():
+            scaler.partial_fit(cls.features(chunk))
+        kmeans = sk_cluster.MiniBatchKMeans(n_clusters=n_clusters, batch_size=BATCH_SIZE, random_state=SEED,
+                                            n_init=3)
+        for _ in range(epochs):
+            for chunk in chunks():
+                X = scaler.transform(cls.features(chunk))
+                # partial_fit initialises the centres on the first chunk, which needs >= k rows
+                if len(X) >= n_clusters:
+                    kmeans.partial_fit(X)
+        return cls(scaler, kmeans)
+
+    @property
+    def n_clusters(self):
+        return self.kmeans.n_clusters
+
+    def assign(self, df):
+        """Cluster of every row of `df`, in one vectorised pass."""
+        if not len(df):
+            return np.empty(0, dtype='int16')
+        return self.kmeans.predict(self.scaler.transform(self.features(df))).astype('int16')
+
+    def centers(self):
+        """Cluster centres in the features' own units."""
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        centers = pd.DataFrame(centers, columns=CLUSTER_FEATURES)
+        centers[LOG_FEATURES] = np.expm1(centers[LOG_FEATURES])
+        centers.index.name = 'cluster'
+        return centers
+
+
+def _chunks(df, rows):
+    def chunks():
+        for start in range(0, len(rows), CHUNK_ROWS):
+            yield df.take(rows[start:start + CHUNK_ROWS])
+    return chunks
+
+
+def model_path(name, version, n_clusters):
+    # One file per number of clusters; the hash covers everything else the fit depends on
+    key = hashlib.sha1(repr((version, CLUSTER_FEATURES, LOG_FEATURES, EPOCHS, SEED)).encode())
+    return SNAPSHOT_DIR / f"{name}_clusters_{key.hexdigest()[:12]}_k{n_clusters}.pkl"
+
+
+def _write_model(model, path, name):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Per-process temp name: several workers may fit the same model at once
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    # Models of older dataset versions (or settings) are never loaded again
+    prefix = path.name.rsplit('_k', 1)[0]
+    for old in path.parent.glob(f"{name}_clusters_*.pkl"):
+        if not old.name.startswith(f"{prefix}_k"):
+            old.unlink(missing_ok=True)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_model(name, version, n_clusters):
+    cache_miss()
+    path = model_path(name, version, n_clusters)
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+        # Truncated, or pickled by incompatible versions (e.g. of scikit-learn): refitted below
+        pass
+    df = load_dataset(name)
+    with span(f"fit_clusters:{name}"):
+        model = ClusterModel.fit(_chunks(df, vinyl_rows(df)), n_clusters)
+    _write_model(model, path, name)
+    return model
+
+
+def load_model(name, n_clusters):
+    """The cluster model of a dataset for `n_clusters`, fitted once per dataset version."""
+    with span(f"cluster_model:{name}"), cache_lookup('cluster_model'):
+        return _load_model(name, dataset_version(name), n_clusters)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _assignments(name, version, n_clusters):
+    cache_miss()
+    df = load_dataset(name)
+    rows = vinyl_rows(df)
+    labels = load_model(name, n_clusters).assign(df.take(rows))
+    rows.flags.writeable = False
+    labels.flags.writeable = False
+    return rows, labels
+
+
+def load_assignments(name, n_clusters):
+    """(row numbers, cluster) of the clustered releases of a dataset (treat as read-only)."""
+    with span(f"cluster_assign:{name}"), cache_lookup('cluster_assignments'):
+        return _assignments(name, dataset_version(name), n_clusters)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _segments(name, version, selection, n_clusters):
+    cache_miss()
+    rows, labels = load_assignments(name, n_clusters)
+    mask = selection_mask(name, selection)
+    if mask is not None:
+        keep = mask[rows]
+        rows, labels = rows[keep], labels[keep]
+    releases = load_dataset(name)[CLUSTER_FEATURES].take(rows).assign(segment=labels)
+    segments = pd.RangeIndex(n_clusters, name='segment')
+    sizes = pd.Series(np.bincount(labels, minlength=n_clusters), index=segments, name='releases')
+    # Segments without (selected) releases keep their row, so every table is in segment order
+    profile = releases.groupby('segment')[CLUSTER_FEATURES].median().reindex(segments)
+    # A fixed sample keeps the scatter light whatever the number of releases
+    sample = releases.sample(min(SAMPLE_POINTS, len(releases)), random_state=0) if len(releases) else releases
+    return {'releases': len(releases), 'sizes': sizes, 'profile': profile, 'sample': sample}
+
+
+def load_segments(name, n_clusters, selection=()):
+    """Sizes, median feature profile and a scatter sample of the segments of the (selected) releases.
+
+    Segments are integers 0 .. n_clusters - 1; computed once per dataset
+    version, selection and number of segments.
+    """
+    with span(f"cluster_segments:{name}"), cache_lookup('cluster_segments'):
+        return _segments(name, dataset_version(name), selection, n_clusters)
@@ -0,0 +1,279 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from pandas.api.types import CategoricalDtype
+
+from utils.deltas import partitions, partitions_version, write_partition
+from utils.fetch import cached_path, fetch_dataset
+from utils.snapshots import read_snapshot, read_style_index, to_categories, write_snapshot, write_style_index
+from utils.styles import StyleIndex
+from utils.tracing import cache_lookup, cache_miss, span
+
+# Copy-on-write makes the shallow copies handed to the pages behave like
+# read-only views: any write on a page copies the touched column instead of
+# changing the frame shared by every session.
+pd.set_option("mode.copy_on_write", True)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# DATASETS_DIR points the app at another copy of the data, e.g. scaled-up benchmark data
+DATA_DIR = Path(os.environ.get("DATASETS_DIR", ROOT_DIR / "data"))
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
+DELTA_DIR = DATA_DIR / "deltas"
+
+# Typed schema of every dataset, applied on load (and when appending rows):
+# text as Arrow-backed strings instead of Python objects, so columns stay
+# in the (mapped) Arrow buffers, and counts and years in the smallest ints
+# that hold them. Prices and ratings stay float64 so the aggregates don't
+# change. Low-cardinality columns are categoricals (see DATASETS below).
+STRING = pd.ArrowDtype(pa.string())
+
+DISCOGS_90S_DTYPES = {
+    'artist': STRING,
+    'title': STRING,
+    'label': STRING,
+    'country': STRING,
+    'format': STRING,
+    'genre': STRING,
+    'styles': STRING,
+    'have': 'int32',
+    'want': 'int32',
+    'num_ratings': 'int32',
+    'lowest_price_(USD)': 'float64',
+    'median price_(USD)': 'float64',
+    'highest_price_(USD)': 'float64',
+    'mean_rating': 'float64',
+    'release_year': 'int16',
+}
+
+DISCOGS_DTYPES = {
+    'artist': STRING,
+    'title': STRING,
+    'label': STRING,
+    'country': STRING,
+    'format': STRING,
+    'genre': STRING,
+    'styles': STRING,
+    'release_id': 'int32',
+    'artist_id': 'int32',
+    'label_id': 'float64',
+    'release_year': 'int16',
+}
+
+MUSIC_SALES_DTYPES = {
+    'Format': STRING,
+    'Metric': STRING,
+    'Year': 'int16',
+    'Value (Actual)': 'float64',
+}
+
+DATASETS = {
+    'music_sales': {
+        'path': DATA_DIR / 'music_sales_clean.csv',
+        'dtype': MUSIC_SALES_DTYPES,
+        'categories': ['Format', 'Metric'],
+    },
+    'discogs_90s': {
+        'path': DATA_DIR / 'discogs_electr_90s_clean.csv',
+        'dtype': DISCOGS_90S_DTYPES,
+        'categories': ['label', 'country', 'format', 'genre'],
+    },
+    'discogs': {
+        # Too large for the repo: fetched from Google Drive into the local dataset cache
+        'url': 'https://drive.google.com/uc?id=1Nj9VxvM0euJj2XRLfsEBh3Io5XhJniKW',
+        'sha256': None,
+        'path': ROOT_DIR / 'discogs_clean.csv',
+        'dtype': DISCOGS_DTYPES,
+        'categories': ['label', 'country', 'format', 'genre'],
+    },
+}
+
+
+def dataset_path(name):
+    """Local path of a dataset, fetching remote datasets into the cache on first use."""
+    config = DATASETS[name]
+    if 'url' not in config:
+        return Path(config['path'])
+    url = config['url']
+    mirror = os.environ.get('DATASETS_MIRROR')
+    if mirror:
+        # Local directory standing in for the remote, e.g. in tests or air-gapped setups
+        url = str(Path(mirror) / Path(config['path']).name)
+    # 'path' is the legacy download location, served as the local copy when offline
+    return fetch_dataset(name, url, sha256=config['sha256'], local_copy=config['path'])
+
+
+def is_available(name):
+    """Whether a dataset can be read without touching the network."""
+    config = DATASETS[name]
+    if 'url' in config and cached_path(name) is not None:
+        return True
+    return Path(config['path']).exists()
+
+
+def snapshot_path(name):
+    return SNAPSHOT_DIR / f"{name}.feather"
+
+
+def style_index_path(name):
+    return SNAPSHOT_DIR / f"{name}_style_index.feather"
+
+
+def schema_version(name):
+    """Short hash of a dataset's typed schema (dtypes and categorical columns)."""
+    config = DATASETS[name]
+    schema = repr((sorted((col, str(dtype)) for col, dtype in config['dtype'].items()),
+                   sorted(config['categories'])))
+    return hashlib.sha1(schema.encode()).hexdigest()[:8]
+
+
+def source_version(name):
+    """Cheap fingerprint of a dataset's base file (mtime + size) and schema; snapshots are tied to it.
+
+    The schema hash makes snapshots, cubes and style indexes written under
+    other dtypes or categories stale, not just those of an older CSV.
+    """
+    stat = os.stat(dataset_path(name))
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{schema_version(name)}"
+
+
+def delta_partitions(name):
+    """Append-only partitions of rows added to a dataset since its base file, oldest first."""
+    return partitions(DELTA_DIR / name)
+
+
+def dataset_version(name):
+    """Fingerprint of a dataset (base file plus delta partitions), used as cache key."""
+    deltas = partitions_version(delta_partitions(name))
+    return f"{source_version(name)}+{deltas}" if deltas else source_version(name)
+
+
+def append_delta(name, df):
+    """Append rows to a dataset as a new delta partition; returns its path."""
+    config = DATASETS[name]
+    missing = [col for col in config['dtype'] if col not in df.columns]
+    if missing:
+        raise ValueError(f"Rows for {name!r} are missing columns: {', '.join(missing)}")
+    return write_partition(df[list(config['dtype'])].astype(config['dtype']), DELTA_DIR / name)
+
+
+def read_delta(name, path):
+    return pd.read_csv(path, dtype=DATASETS[name]['dtype'])
+
+
+def append_rows(df, deltas, categories):
+    """`df` followed by the rows of `deltas`, keeping the categorical columns categorical."""
+    parts = [df] + list(deltas)
+    for col in categories:
+        if col not in df.columns:
+            continue
+        # Same (sorted) categories everywhere, so concat keeps the codes instead of the strings
+        dtype = CategoricalDtype(pd.Index(df[col].cat.categories).union(
+            pd.Index(pd.unique(pd.concat([d[col] for d in deltas]).dropna()))))
+        parts = [part.astype({col: dtype}) for part in parts]
+    return pd.concat(parts, ignore_index=True)
+
+
+def read_csv_dataset(name):
+    config = DATASETS[name]
+    with span(f"read_csv:{name}"):
+        df = pd.read_csv(dataset_path(name), dtype=config['dtype'])
+    return to_categories(df, config['categories'])
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _read_dataset(name, version, deltas=()):
+    # `version` (of the base file) and the delta partitions are the cache key:
+    # a changed file or a new partition gets a new entry.
+    cache_miss()
+    if deltas:
+        # The base stays cached on its own; only the new partitions are parsed
+        with span(f"read_deltas:{name}"):
+            frames = [_read_delta(name, path) for path in deltas]
+        return append_rows(_read_dataset(name, version), frames, DATASETS[name]['categories'])
+    # Prefer the columnar snapshot and fall back to parsing the CSV.
+    with span(f"read_snapshot:{name}"):
+        df = read_snapshot(snapshot_path(name), version, arrow_strings=True)
+    if df is None:
+        df = read_csv_dataset(name)
+    return df
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _read_delta(name, path):
+    # Partitions are never modified, so the path is a sufficient key
+    return read_delta(name, path)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _read_style_index(name, version, deltas=()):
+    cache_miss()
+    if deltas:
+        index = _read_style_index(name, version)
+        for path in deltas:
+            index = index.append(StyleIndex.from_strings(_read_delta(name, path)['styles']))
+        return index
+    with span(f"read_style_index:{name}"):
+        index = read_style_index(style_index_path(name), version)
+    if index is None:
+        index = StyleIndex.from_strings(_read_dataset(name, version)['styles'])
+    return index
+
+
+def load_dataset(name, with_deltas=True):
+    """Return a read-only view of a dataset, parsed once per process and file version.
+
+    With `with_deltas=False` only the base file is returned, without the rows
+    of its delta partitions.
+    """
+    deltas = tuple(delta_partitions(name)) if with_deltas else ()
+    with span(f"load:{name}"), cache_lookup('dataset'):
+        df = _read_dataset(name, source_version(name), deltas)
+    return df.copy(deep=False)
+
+
+def load_style_index(name, with_deltas=True):
+    """Return the shared integer-coded style index of a dataset (treat as read-only)."""
+    deltas = tuple(delta_partitions(name)) if with_deltas else ()
+    with span(f"load_style_index:{name}"), cache_lookup('style_index'):
+        return _read_style_index(name, source_version(name), deltas)
+
+
+def load_exploded(name):
+    """Return the dataset with one row per (release, style)."""
+    rows, styles = load_style_index(name).explode()
+    # Plain strings (shared with the vocabulary) so charts only see observed styles
+    return load_dataset(name).take(rows).assign(styles=styles.to_numpy())
+
+
+def load_music_sales():
+    return load_dataset('music_sales')
+
+
+def load_discogs_90s():
+    return load_dataset('discogs_90s')
+
+
+def build_snapshot(name):
+    """Write the columnar snapshots of a dataset's base file next to the CSV outputs."""
+    version = source_version(name)
+    df = read_csv_dataset(name)
+    write_snapshot(df, snapshot_path(name), version)
+    if 'styles' in df.columns:
+        write_style_index(StyleIndex.from_strings(df['styles']), style_index_path(name), version)
+
+
+def build_all_snapshots():
+    for name in DATASETS:
+        if is_available(name):
+            build_snapshot(name)
+            print(f"Snapshot written for {name}")
+        else:
+            print(f"Skipping {name}: no local copy found")
+
+
+if __name__ == "__main__":
+    build_all_snapshots()
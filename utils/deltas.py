@@ -0,0 +1,84 @@
+"""Append-only delta partitions of new rows for a dataset.
+
+New releases or sales rows are not merged into the cleaned CSV: each batch is
+written as an immutable partition named after its ingestion time,
+
+    data/deltas/<dataset>/<YYYYmmddTHHMMSSffffff>.csv
+
+and the data layer reads the base dataset plus its partitions (see
+utils/data.py). The aggregate cubes keep their mergeable partial state, so a
+refresh folds in only the partitions they have not seen (see
+utils/aggregates.py).
+
+    python -m utils.deltas append discogs_90s new_releases.csv
+    python -m utils.deltas list
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def partitions(directory):
+    """Delta partitions in `directory`, oldest first."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.iterdir() if path.suffix == '.csv')
+
+
+def partitions_version(paths):
+    """Fingerprint of a list of partitions; they are never modified, so the names suffice."""
+    if not paths:
+        return ''
+    return f"d{len(paths)}-{paths[-1].stem}"
+
+
+def write_partition(df, directory, ingested_at=None):
+    """Write `df` as a new partition and return its path."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    ingested_at = ingested_at or datetime.now(timezone.utc)
+    path = directory / f"{ingested_at:%Y%m%dT%H%M%S%f}.csv"
+    while path.exists():
+        # Two appends within the same microsecond: keep the order, don't overwrite
+        path = path.with_name(f"{path.stem}_.csv")
+    tmp_path = path.with_suffix('.tmp')
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main(argv=None):
+    from utils.aggregates import CUBES, refresh_cube
+    from utils.data import DATASETS, append_delta, delta_partitions, is_available
+
+    parser = argparse.ArgumentParser(description="Append-only delta partitions of the datasets")
+    commands = parser.add_subparsers(dest='command', required=True)
+    append = commands.add_parser('append', help="append the rows of a CSV file as a new partition")
+    append.add_argument('dataset', choices=list(DATASETS))
+    append.add_argument('csv', type=Path)
+    append.add_argument('--no-refresh', action='store_true', help="don't fold the rows into the stored cube")
+    commands.add_parser('list', help="list the partitions of every dataset")
+    args = parser.parse_args(argv)
+
+    if args.command == 'append':
+        import pandas as pd
+
+        path = append_delta(args.dataset, pd.read_csv(args.csv))
+        print(f"Appended {path}")
+        if args.dataset in CUBES and not args.no_refresh and is_available(args.dataset):
+            refresh_cube(args.dataset)
+            print(f"Aggregate cube refreshed for {args.dataset}")
+    else:
+        for name in DATASETS:
+            paths = delta_partitions(name)
+            print(f"{name}: {len(paths)} partition(s)")
+            for path in paths:
+                print(f"    {path.name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""Out-of-core aggregation over the full Discogs catalogue.
+
+The catalogue is scanned in record batches (memory-mapped from the Arrow
+snapshot when there is one, streamed from the CSV otherwise). Each batch is
+reduced to small partial aggregates with Arrow compute kernels on a thread
+pool, and the partials are merged as they come in, so memory stays bounded by
+a few batches plus the size of the aggregates rather than the row count.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.imports import lazy_import
+from utils.sketches import FrequentItems, HyperLogLog
+from utils.snapshots import open_snapshot
+from utils.styles import StyleIndex
+
+SCAN_COLUMNS = ['label', 'country', 'format', 'genre', 'styles', 'release_year']
+MAX_YEAR = 2020
+STYLES_PRECISION = 14
+BLOCK_SIZE = 16 << 20
+BATCH_ROWS = 1 << 16
+
+# Only needed when there is no snapshot to scan
+pa_csv = lazy_import('pyarrow.csv')
+
+
+def iter_batches(csv_path, snapshot_path=None, version=None, columns=SCAN_COLUMNS, block_size=BLOCK_SIZE,
+                 batch_rows=BATCH_ROWS):
+    """Yield record batches of `columns`, preferring a fresh snapshot over the CSV."""
+    reader = open_snapshot(snapshot_path, version) if snapshot_path is not None else None
+    if reader is not None:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            # Snapshots are a single batch; zero-copy slices keep the work per batch bounded
+            for start in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(start, batch_rows)
+        return
+    column_types = {col: pa.string() for col in columns if col != 'release_year'}
+    column_types['release_year'] = pa.int64()
+    stream = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size, use_threads=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types=column_types),
+    )
+    yield from stream
+
+
+def iter_selected(batches, mask):
+    """Yield the rows of `batches` set in `mask`, a boolean array over their rows in order."""
+    start = 0
+    for batch in batches:
+        keep = mask[start:start + batch.num_rows]
+        start += batch.num_rows
+        if keep.any():
+            yield batch.filter(pa.array(keep))
+    if start != len(mask):
+        raise ValueError(f"Selection of {len(mask)} rows applied to {start} scanned rows")
+
+
+def _decoded(batch):
+    # Dictionary columns from the snapshot carry per-batch dictionaries
+    columns = [col.dictionary_decode() if pa.types.is_dictionary(col.type) else col for col in batch.columns]
+    table = pa.Table.from_arrays(columns, names=batch.schema.names)
+    # Snapshots store small ints; partials from any source must have the same schema to merge
+    if 'release_year' in table.column_names:
+        i = table.column_names.index('release_year')
+        table = table.set_column(i, 'release_year', pc.cast(table.column(i), pa.int64()))
+    return table
+
+
+def _value_counts(array):
+    counts = pc.value_counts(pc.drop_null(array))
+    return pd.Series(counts.field('counts').to_numpy(zero_copy_only=False),
+                     index=counts.field('values').to_pandas())
+
+
+def _group_count(table, keys):
+    grouped = table.select(keys).drop_null().group_by(keys).aggregate([([], 'count_all')])
+    return grouped.to_pandas().set_index(keys)['count_all']
+
+
+def _group_unique(table, keys):
+    # Kept as an Arrow table so merging partials stays in Arrow kernels; compacted
+    # so it doesn't hold on to (or pickle) the many small chunks of the group-by
+    return table.select(keys).drop_null().group_by(keys).aggregate([]).combine_chunks()
+
+
+def _count_unique(unique_rows, keys, column):
+    # Rows are already unique, so counting rows per key counts distinct values
+    counts = unique_rows.group_by(keys).aggregate([([], 'count_all')]).to_pandas()
+    return counts.set_index(keys)['count_all'].sort_index().rename(column)
+
+
+def partial_aggregates(batch, sketch=False):
+    """Reduce one batch to the partial aggregates needed by page 2.
+
+    With `sketch`, rankings and distinct counts are kept as mergeable
+    sketches (see utils/sketches.py), whose size does not grow with the
+    number of labels and styles.
+    """
+    table = _decoded(batch)
+    electronic = table.filter(pc.equal(table['genre'], 'Electronic'))
+    recent = table.filter(pc.less_equal(table['release_year'], MAX_YEAR))
+    recent_electronic = electronic.filter(pc.less_equal(electronic['release_year'], MAX_YEAR))
+
+    # (year, style) pairs of the recent electronic releases, via the style index
+    years = pd.Series(recent_electronic['release_year'].to_numpy(), name='release_year')
+    year_styles = StyleIndex.from_strings(recent_electronic['styles']).counts_by(years)
+    if sketch:
+        recent_labels = recent.select(['release_year', 'genre', 'label']).drop_null()
+        return {
+            'genre_counts': FrequentItems.from_counts(_value_counts(table['genre'])),
+            'format_counts': FrequentItems.from_counts(_value_counts(table['format'])),
+            'country_counts': FrequentItems.from_counts(_value_counts(table['country'])),
+            'electronic_country_counts': FrequentItems.from_counts(_value_counts(electronic['country'])),
+            'year_genre_counts': _group_count(recent, ['release_year', 'genre']),
+            'year_genre_labels': HyperLogLog.from_values(
+                pd.MultiIndex.from_arrays([recent_labels['release_year'].to_numpy(),
+                                           recent_labels['genre'].to_numpy(zero_copy_only=False)],
+                                          names=['release_year', 'genre']),
+                recent_labels['label'].to_numpy(zero_copy_only=False)),
+            # Only one key per year, so more registers keep the few hundred styles apart
+            'year_styles': HyperLogLog.from_values(
+                pd.Index(year_styles.index.get_level_values('release_year')),
+                year_styles.index.get_level_values('styles'), precision=STYLES_PRECISION),
+        }
+    year_styles = pa.table({
+        'release_year': pa.array(year_styles.index.get_level_values('release_year'), pa.int64()),
+        'styles': pa.array(year_styles.index.get_level_values('styles'), pa.string()),
+    })
+
+    return {
+        'genre_counts': _value_counts(table['genre']),
+        'format_counts': _value_counts(table['format']),
+        'country_counts': _value_counts(table['country']),
+        'electronic_country_counts': _value_counts(electronic['country']),
+        'year_genre_counts': _group_count(recent, ['release_year', 'genre']),
+        'year_genre_labels': _group_unique(recent, ['release_year', 'genre', 'label']),
+        'year_styles': year_styles,
+    }
+
+
+def merge_partials(total, part):
+    """Fold one batch's partial aggregates into the running totals."""
+    if total is None:
+        return part
+    merged = {}
+    for key, value in part.items():
+        if isinstance(value, (FrequentItems, HyperLogLog)):
+            merged[key] = total[key].merge(value)
+        elif isinstance(value, pa.Table):
+            merged[key] = _group_unique(pa.concat_tables([total[key], value]), value.column_names)
+        else:
+            merged[key] = total[key].add(value, fill_value=0).astype('int64')
+    return merged
+
+
+def _distinct_counts(value, keys, column):
+    if isinstance(value, HyperLogLog):
+        counts = value.estimate().rename(column)
+        counts.index.names = keys
+        return counts
+    return _count_unique(value, keys, column)
+
+
+def finalize(total):
+    """Turn merged partials into the tables the page 2 charts are drawn from.
+
+    Sketched partials give approximate tables, plus their error bounds under
+    'errors': the most a count can be below the true count, and the
+    relative standard error of the distinct counts.
+    """
+    counts = {}
+    errors = {}
+    for key in ['genre_counts', 'format_counts', 'country_counts', 'electronic_country_counts']:
+        value = total[key]
+        if isinstance(value, FrequentItems):
+            errors[key] = value.error
+            value = value.top()
+        counts[key] = series = value.sort_values(ascending=False, kind='stable')
+        series.index.name = key.replace('electronic_', '').replace('_counts', '')
+        series.name = 'count'
+    for key in ['year_genre_labels', 'year_styles']:
+        if isinstance(total[key], HyperLogLog):
+            errors[key] = total[key].relative_error
+    year_genre_counts = total['year_genre_counts'].sort_index()
+    year_genre_counts.name = None
+    tables = {
+        **counts,
+        'year_genre_counts': year_genre_counts,
+        'year_genre_labels': _distinct_counts(total['year_genre_labels'], ['release_year', 'genre'], 'label'),
+        'year_styles': _distinct_counts(total['year_styles'], ['release_year'], 'styles'),
+    }
+    if errors:
+        tables['errors'] = errors
+    return tables
+
+
+def scan_partials(batches, max_workers=None, max_pending=None, sketch=False):
+    """Reduce a stream of batches, in parallel and with bounded memory, to merged partials.
+
+    The result can still be merged with the partials of further batches (e.g.
+    newly appended rows) before it is finalized.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    reduce_batch = partial(partial_aggregates, sketch=sketch)
+    total = None
+    pending = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch in batches:
+            pending.append(pool.submit(reduce_batch, batch))
+            # Only keep a few batches in flight so memory does not grow with the file
+            if len(pending) >= max_pending:
+                total = merge_partials(total, pending.pop(0).result())
+        for future in pending:
+            total = merge_partials(total, future.result())
+    if total is None:
+        total = reduce_batch(pa.record_batch(
+            [pa.array([], pa.string())] * 5 + [pa.array([], pa.int64())], names=SCAN_COLUMNS))
+    return total
+
+
+def scan_aggregates(batches, max_workers=None, max_pending=None, sketch=False):
+    """Aggregate a stream of batches in parallel with bounded memory."""
+    return finalize(scan_partials(batches, max_workers, max_pending, sketch))
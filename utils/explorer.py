@@ -0,0 +1,82 @@
+import pandas as pd
+import streamlit as st
+
+from utils.tracing import cache_lookup, cache_miss, count_bytes_sent, span
+
+NO_FILTER = '(no filter)'
+
+
+# The helpers below are keyed by `dataset_key` (dataset name and version); the
+# frame itself is passed unhashed and shared by every session.
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _sort_order(dataset_key, column, ascending, _df):
+    cache_miss()
+    values = _df[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable').index.to_numpy()
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _filter_mask(dataset_key, column, query, _df):
+    cache_miss()
+    if isinstance(query, tuple):
+        values = _df[column]
+        return ((values >= query[0]) & (values <= query[1])).to_numpy()
+    return _df[column].astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def column_stats(dataset_key, _df):
+    """Per-column summary shown next to the raw data."""
+    stats = pd.DataFrame({
+        'dtype': _df.dtypes.astype(str),
+        'non-null': _df.count(),
+        'unique': _df.nunique(),
+    })
+    numeric = _df.select_dtypes('number')
+    stats['min'] = numeric.min()
+    stats['mean'] = numeric.mean()
+    stats['max'] = numeric.max()
+    return stats
+
+
+def raw_data_explorer(df, dataset_key, page_size=50):
+    """Paged, sortable and filterable view of a frame.
+
+    Sorting and filtering run on the server (and are cached per dataset), and
+    only the rows of the current page are sent to the browser.
+    """
+    key = f"explorer_{dataset_key}"
+    col1, col2, col3, col4 = st.columns(4)
+    sort_column = col1.selectbox('Sort by', list(df.columns), key=f"{key}_sort")
+    ascending = col2.toggle('Ascending', value=True, key=f"{key}_ascending")
+    filter_column = col3.selectbox('Filter on', [NO_FILTER] + list(df.columns), key=f"{key}_filter")
+
+    with span("explorer:sort"), cache_lookup('explorer'):
+        order = _sort_order(dataset_key, sort_column, ascending, df)
+    query = None
+    if filter_column != NO_FILTER and pd.api.types.is_numeric_dtype(df[filter_column]):
+        stats = column_stats(dataset_key, df)
+        low, high = float(stats.at[filter_column, 'min']), float(stats.at[filter_column, 'max'])
+        if low < high:
+            selected = col4.slider('Range', low, high, (low, high), key=f"{key}_range_{filter_column}")
+            query = selected if selected != (low, high) else None
+    elif filter_column != NO_FILTER:
+        query = col4.text_input('Contains', key=f"{key}_query_{filter_column}") or None
+    if query is not None:
+        with span("explorer:filter"), cache_lookup('explorer'):
+            mask = _filter_mask(dataset_key, filter_column, query, df)
+        order = order[mask[order]]
+
+    n_pages = max(1, -(-len(order) // page_size))
+    page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    rows = df.take(order[start:start + page_size])
+    # In-memory size of the page, a close enough stand-in for the Arrow payload
+    count_bytes_sent('table', int(rows.memory_usage(deep=True).sum()))
+    st.dataframe(rows, use_container_width=True)
+    st.caption(f"Rows {start + 1:,}–{min(start + page_size, len(order)):,} of {len(order):,} "
+               f"({len(df):,} in total)")
+
+    with st.expander('Column statistics'):
+        st.dataframe(column_stats(dataset_key, df), use_container_width=True)
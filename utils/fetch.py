@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Downloaded files live in a content-addressed store: blobs/<sha256> plus one
+# small manifest per dataset pointing at the current blob.
+CACHE_DIR = Path(os.environ.get('DATASETS_CACHE_DIR', ROOT_DIR / '.cache' / 'datasets'))
+
+
+def is_offline():
+    return os.environ.get('DATASETS_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def sha256_of(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def file_lock(path, timeout=900, poll_interval=0.5, stale_after=3600):
+    """Cross-process lock based on exclusive creation of a lock file.
+
+    A lock untouched for `stale_after` seconds was left by a dead process and
+    is taken over; the holder touches its lock file while it holds it, so
+    downloads of any length keep theirs.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.monotonic()
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                # A worker that died mid-download leaves its lock behind
+                if time.time() - path.stat().st_mtime > stale_after:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"Timed out waiting for lock {path}")
+            time.sleep(poll_interval)
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(stale_after / 4):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return
+
+    threading.Thread(target=heartbeat, name=f"lock:{path.name}", daemon=True).start()
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        yield
+    finally:
+        stop.set()
+        os.close(fd)
+        path.unlink(missing_ok=True)
+
+
+def manifest_path(name):
+    return CACHE_DIR / f"{name}.json"
+
+
+def blob_path(sha256):
+    return CACHE_DIR / 'blobs' / sha256
+
+
+def cached_path(name):
+    """Path of the cached copy of a dataset, or None if nothing is cached yet."""
+    try:
+        manifest = json.loads(manifest_path(name).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    path = blob_path(manifest['sha256'])
+    return path if path.exists() else None
+
+
+def _download(url, output):
+    parsed = urlparse(url)
+    if parsed.scheme in ('', 'file'):
+        # Local stand-in for the remote (e.g. a copy on disk or a test fixture)
+        shutil.copyfile(parsed.path if parsed.scheme else url, output)
+    else:
+        import gdown
+        gdown.download(url, str(output), quiet=False)
+
+
+def _store(name, url, tmp_path, sha256):
+    """Verify a finished download and move it into the store atomically."""
+    actual = sha256_of(tmp_path)
+    if sha256 is not None and actual != sha256:
+        tmp_path.unlink(missing_ok=True)
+        raise ValueError(f"Checksum mismatch for {name}: expected {sha256}, got {actual}")
+    path = blob_path(actual)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, path)
+
+    manifest = {'url': url, 'sha256': actual, 'fetched_at': time.time()}
+    tmp_manifest = manifest_path(name).with_suffix('.json.tmp')
+    tmp_manifest.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp_manifest, manifest_path(name))
+    return path
+
+
+def fetch_dataset(name, url, sha256=None, local_copy=None, offline=None):
+    """Return a local path for a remote dataset, downloading it at most once.
+
+    Concurrent workers serialise on a lock file, so only the first one
+    downloads and the others pick up its result. In offline mode (or with
+    ``DATASETS_OFFLINE=1``) nothing is downloaded: the cached copy is served,
+    falling back to ``local_copy`` if one exists on disk.
+    """
+    path = cached_path(name)
+    if path is not None and (sha256 is None or path.name == sha256):
+        return path
+
+    if offline is None:
+        offline = is_offline()
+    if offline:
+        if path is not None:
+            return path
+        if local_copy is not None and Path(local_copy).exists():
+            return Path(local_copy)
+        raise FileNotFoundError(f"No local copy of dataset {name!r} available in offline mode")
+
+    with file_lock(CACHE_DIR / f"{name}.lock"):
+        # Another worker may have finished the download while we waited
+        path = cached_path(name)
+        if path is not None and (sha256 is None or path.name == sha256):
+            return path
+        tmp_path = CACHE_DIR / f"{name}.{os.getpid()}.part"
+        try:
+            _download(url, tmp_path)
+            return _store(name, url, tmp_path, sha256)
+        finally:
+            tmp_path.unlink(missing_ok=True)
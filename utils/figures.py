@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+import streamlit as st
+
+from utils.tracing import count_bytes_sent, count_cache_lookup, metrics, span
+
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MAX_BYTES', 64 << 20))
+
+
+class FigureCache:
+    """Thread-safe LRU of built figures, capped by the total size of their JSON in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The (figure, size in bytes) cached under `key`, or None."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, figure, n_bytes):
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            if n_bytes > self.max_bytes:
+                return
+            self._items[key] = (figure, n_bytes)
+            self._size += n_bytes
+            # Evict least recently used figures until we are under the cap
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._size -= evicted
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per process, shared by every session
+figure_cache = FigureCache(FIGURE_CACHE_MAX_BYTES)
+metrics.gauge('app_figure_cache_bytes', lambda: figure_cache.stats()['bytes'], "Size of the cached figure JSON")
+metrics.gauge('app_figure_cache_entries', lambda: figure_cache.stats()['entries'], "Figures in the figure cache")
+
+
+def cached_figure(chart_id, version, build, **params):
+    """(figure, size of its JSON) for (dataset version, chart id, parameters), built on a miss.
+
+    `build(**params)` must return the finished plotly figure. The figure is
+    shared by every session: treat it as read-only.
+    """
+    key = (version, chart_id, tuple(sorted(params.items())))
+    entry = figure_cache.get(key)
+    count_cache_lookup('figure', hit=entry is not None)
+    if entry is None:
+        with span(f"build:{chart_id}"):
+            fig = build(**params)
+        # Sized once, for the cache's byte cap and the bytes-sent metric
+        entry = (fig, len(pio.to_json(fig, validate=False)))
+        figure_cache.put(key, *entry)
+    return entry
+
+
+def cached_plotly_chart(chart_id, version, build, use_container_width=False, theme="streamlit", **params):
+    """Like st.plotly_chart, but draws the cached figure without rebuilding it."""
+    with span(f"chart:{chart_id}"):
+        fig, n_bytes = cached_figure(chart_id, version, build, **params)
+        count_bytes_sent('figure', n_bytes)
+        return st.plotly_chart(fig, use_container_width=use_container_width, theme=theme)
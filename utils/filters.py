@@ -0,0 +1,207 @@
+"""Interactive release filters, resolved on precomputed row-id indexes.
+
+For every filterable column the row ids of each value are stored sorted by
+value (CSR, like the style index), so selecting some values is a scatter of
+their rows into a mask and combining columns is a bitwise AND: no column is
+compared row by row on a rerun. The pages get the selection as a hashable
+tuple from `filter_panel` and re-aggregate only the selected rows.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+
+from utils.data import dataset_version, load_dataset, load_style_index
+from utils.tracing import cache_lookup, cache_miss, debug_panel, span
+
+FILTER_COLUMNS = ['country', 'label', 'format', 'styles', 'release_year']
+
+
+class ColumnIndex:
+    """Rows of every distinct value of a column.
+
+    The rows holding ``values[i]`` are ``rows[offsets[i]:offsets[i + 1]]``;
+    `values` are sorted, so a range of values is a single slice.
+    """
+
+    def __init__(self, values, rows, offsets):
+        self.values = pd.Index(values)
+        self.rows = np.asarray(rows, dtype='int64')
+        self.offsets = np.asarray(offsets, dtype='int64')
+        self.rows.flags.writeable = False
+        self.offsets.flags.writeable = False
+        self._strings = None
+
+    @classmethod
+    def from_codes(cls, codes, values, rows=None):
+        """Build from integer codes into `values` (-1 for missing), one per entry.
+
+        `rows` gives the row of every entry when a row can hold several values
+        (e.g. styles); by default entry i is row i.
+        """
+        codes = np.asarray(codes, dtype='int64')
+        rows = np.arange(len(codes)) if rows is None else np.asarray(rows)
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        offsets = np.zeros(len(values) + 1, dtype='int64')
+        np.cumsum(np.bincount(codes[order], minlength=len(values)), out=offsets[1:])
+        return cls(values, rows[order], offsets)
+
+    @classmethod
+    def from_series(cls, series):
+        codes, values = pd.factorize(series, sort=True)
+        return cls.from_codes(codes, values)
+
+    @property
+    def counts(self):
+        """Number of rows per value."""
+        return pd.Series(np.diff(self.offsets), index=self.values, name='count')
+
+    def positions(self, values):
+        return self.values.get_indexer(pd.Index(values))
+
+    def matching(self, text):
+        """Positions of the values containing `text` (case-insensitive)."""
+        if self._strings is None:
+            self._strings = pa.array(self.values.astype(str), type=pa.string())
+        return np.flatnonzero(pc.match_substring(self._strings, text, ignore_case=True).to_numpy(zero_copy_only=False))
+
+    def mark(self, mask, positions):
+        """Set the rows of the values at `positions` in `mask`."""
+        positions = np.asarray(positions, dtype='int64')
+        positions = positions[positions >= 0]
+        starts, stops = self.offsets[positions], self.offsets[positions + 1]
+        lengths = stops - starts
+        # Concatenated row-id slices of every value, without a Python loop
+        entries = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        mask[self.rows[entries]] = True
+        return mask
+
+    def mark_range(self, mask, low, high):
+        """Set the rows of the values in [low, high] in `mask`."""
+        start = self.offsets[self.values.searchsorted(low, side='left')]
+        stop = self.offsets[self.values.searchsorted(high, side='right')]
+        mask[self.rows[start:stop]] = True
+        return mask
+
+
+class FilterIndex:
+    """Row-id indexes of the filterable columns of a dataset."""
+
+    def __init__(self, n_rows, columns):
+        self.n_rows = n_rows
+        self.columns = columns
+
+    @classmethod
+    def build(cls, df, style_index=None):
+        columns = {col: ColumnIndex.from_series(df[col]) for col in FILTER_COLUMNS
+                   if col in df.columns and col != 'styles'}
+        if style_index is not None:
+            # Multi-valued: every (release, style) entry points back to its release
+            columns['styles'] = ColumnIndex.from_codes(style_index.codes, style_index.vocabulary,
+                                                       rows=style_index.release_rows)
+        return cls(len(df), columns)
+
+    def mask(self, selection):
+        """Boolean mask of the rows matching every filter of `selection`, or None for no filter.
+
+        `selection` is a tuple of (column, filter) pairs, where a filter is a
+        tuple of values (any of them matches), a (low, high) range for the
+        year, or a search text for the label.
+        """
+        if not selection:
+            return None
+        result = np.ones(self.n_rows, dtype=bool)
+        for column, condition in selection:
+            index = self.columns[column]
+            selected = np.zeros(self.n_rows, dtype=bool)
+            if column == 'release_year':
+                index.mark_range(selected, *condition)
+            elif isinstance(condition, str):
+                index.mark(selected, index.matching(condition))
+            else:
+                index.mark(selected, index.positions(condition))
+            result &= selected
+        return result
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _build_filter_index(name, version):
+    cache_miss()
+    df = load_dataset(name)
+    style_index = load_style_index(name) if 'styles' in df.columns else None
+    return FilterIndex.build(df, style_index)
+
+
+def load_filter_index(name):
+    """Return the shared filter index of a dataset, built once per dataset version."""
+    with span(f"filter_index:{name}"), cache_lookup('filter_index'):
+        return _build_filter_index(name, dataset_version(name))
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _selection_mask(name, version, selection):
+    cache_miss()
+    mask = load_filter_index(name).mask(selection)
+    mask.flags.writeable = False
+    return mask
+
+
+def selection_mask(name, selection):
+    """Mask of the rows of a dataset matching `selection` (None when nothing is filtered)."""
+    if not selection:
+        return None
+    with span("filter:mask"), cache_lookup('filter_mask'):
+        return _selection_mask(name, dataset_version(name), selection)
+
+
+def selection_key(selection):
+    """Short suffix identifying a selection in cache keys ('' when nothing is filtered)."""
+    if not selection:
+        return ''
+    return '~' + hashlib.sha1(repr(selection).encode()).hexdigest()[:12]
+
+
+def filter_panel(name, key):
+    """Sidebar filters for the charts of a page; returns the selection (() for none).
+
+    The index is only built once filtering is switched on, so the pages cost
+    nothing extra when it isn't used. When nothing matches, the page stops
+    here with a warning.
+    """
+    sidebar = st.sidebar
+    if not sidebar.toggle('Filter the charts', key=f"{key}_on"):
+        return ()
+    index = load_filter_index(name)
+    selection = []
+    for column, label in [('country', 'Country'), ('format', 'Format'), ('styles', 'Style')]:
+        if column not in index.columns:
+            continue
+        # Most common values first
+        options = index.columns[column].counts.sort_values(ascending=False, kind='stable')
+        chosen = sidebar.multiselect(label, options[options > 0].index.tolist(), key=f"{key}_{column}")
+        if chosen:
+            selection.append((column, tuple(sorted(chosen))))
+    # Too many labels for a list: match them by name instead
+    label_text = sidebar.text_input('Label contains', key=f"{key}_label").strip()
+    if label_text:
+        selection.append(('label', label_text))
+    years = index.columns['release_year'].values
+    low, high = int(years.min()), int(years.max())
+    if low < high:
+        chosen = sidebar.slider('Release year', low, high, (low, high), key=f"{key}_years")
+        if chosen != (low, high):
+            selection.append(('release_year', chosen))
+    selection = tuple(selection)
+
+    mask = selection_mask(name, selection)
+    n_selected = index.n_rows if mask is None else int(np.count_nonzero(mask))
+    sidebar.caption(f"{n_selected:,} of {index.n_rows:,} releases selected")
+    if not n_selected:
+        st.warning("No releases match the selected filters.")
+        debug_panel()
+        st.stop()
+    return selection
@@ -0,0 +1,92 @@
+"""Network of the styles that appear together on the same releases.
+
+The co-occurrence counts come from the sparse release x style incidence
+matrix (see `StyleIndex.cooccurrence`). Only the most common styles are
+kept, linked where their overlap (Jaccard: releases with both / releases
+with either) reaches a threshold, and the graph is laid out once per
+dataset version, selection and parameters; reruns reuse the positions.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import dataset_version, load_style_index
+from utils.filters import selection_mask
+from utils.imports import lazy_import
+from utils.tracing import cache_lookup, cache_miss, span
+
+# Only needed for the layout
+nx = lazy_import('networkx')
+
+LAYOUT_SEED = 42
+
+
+def style_graph(cooccurrence, vocabulary, top_n, min_jaccard):
+    """Nodes (style, releases) and edges (source, target, releases, jaccard) of the style network."""
+    counts = cooccurrence.diagonal()
+    top = np.argsort(-counts, kind='stable')[:top_n]
+    top = top[counts[top] > 0]
+    shared = cooccurrence[top][:, top].tocoo()
+    # Each pair once, without the diagonal
+    upper = shared.row < shared.col
+    source, target, both = shared.row[upper], shared.col[upper], shared.data[upper]
+    jaccard = both / (counts[top][source] + counts[top][target] - both)
+    keep = jaccard >= min_jaccard
+    nodes = pd.DataFrame({'style': vocabulary.take(top), 'releases': counts[top]})
+    edges = pd.DataFrame({'source': source[keep], 'target': target[keep], 'releases': both[keep],
+                          'jaccard': jaccard[keep]})
+    return nodes, edges
+
+
+def layout(nodes, edges):
+    """Force-directed (x, y) of every node; strongly overlapping styles end up close."""
+    graph = nx.Graph()
+    graph.add_nodes_from(range(len(nodes)))
+    graph.add_weighted_edges_from(zip(edges['source'], edges['target'], edges['jaccard']))
+    positions = nx.spring_layout(graph, weight='weight', seed=LAYOUT_SEED, k=1.5 / np.sqrt(max(len(nodes), 1)))
+    return np.array([positions[i] for i in range(len(nodes))]).reshape(-1, 2)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _style_network(name, version, selection, top_n, min_jaccard):
+    cache_miss()
+    index = load_style_index(name)
+    with span("graph:cooccurrence"):
+        cooccurrence = index.cooccurrence(selection_mask(name, selection))
+    nodes, edges = style_graph(cooccurrence, index.vocabulary, top_n, min_jaccard)
+    with span("graph:layout"):
+        positions = layout(nodes, edges)
+    return nodes.assign(x=positions[:, 0], y=positions[:, 1]), edges
+
+
+def load_style_network(name, selection=(), top_n=30, min_jaccard=0.05):
+    """Laid-out style network of a dataset (or of the selected releases), computed once per version."""
+    with span(f"style_network:{name}"), cache_lookup('style_network'):
+        return _style_network(name, dataset_version(name), selection, top_n, min_jaccard)
+
+
+def network_figure(nodes, edges, title=None):
+    """Plotly figure of a laid-out network; thicker lines for larger overlaps."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    # One line trace per overlap band (None breaks the line between edges), instead of one per edge
+    bands = pd.cut(edges['jaccard'], bins=[0, 0.1, 0.25, 1], include_lowest=True, labels=[1, 2.5, 5])
+    for width, band in edges.groupby(bands, observed=True):
+        x = np.column_stack([nodes['x'].to_numpy()[band['source']], nodes['x'].to_numpy()[band['target']],
+                             np.full(len(band), np.nan)]).ravel()
+        y = np.column_stack([nodes['y'].to_numpy()[band['source']], nodes['y'].to_numpy()[band['target']],
+                             np.full(len(band), np.nan)]).ravel()
+        fig.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(width=float(width), color='#C9A0DC'),
+                                 hoverinfo='skip', showlegend=False))
+    size = 10 + 40 * np.sqrt(nodes['releases'] / max(nodes['releases'].max(), 1))
+    fig.add_trace(go.Scatter(
+        x=nodes['x'], y=nodes['y'], mode='markers+text', text=nodes['style'], textposition='top center',
+        marker=dict(size=size, color='#A020F0', line=dict(width=1, color='white')),
+        customdata=nodes['releases'], hovertemplate="%{text}: %{customdata:,} releases<extra></extra>",
+        showlegend=False,
+    ))
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    fig.update_layout(title=title, height=700, plot_bgcolor='white')
+    return fig
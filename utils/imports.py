@@ -0,0 +1,147 @@
+"""Lazy imports for heavy optional modules, and an import-time profiler for the pages.
+
+Profile the cold-start imports of every page (each in a fresh interpreter):
+
+    python -m utils.imports
+    python -m utils.imports --top 15 --output import_profile.json
+    python -m utils.imports --compare import_profile.json   # flag regressions
+"""
+import argparse
+import ast
+import importlib
+import json
+import os
+import subprocess
+import sys
+import types
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PAGES = [ROOT_DIR / 'Intro.py'] + sorted((ROOT_DIR / 'pages').glob('*.py'))
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access."""
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # Later lookups find the module's attributes directly
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """Module proxy that is only imported on first attribute access.
+
+    Use it for heavy modules needed by a single code path, so pages that never
+    reach that path don't pay for the import:
+
+        pa_csv = lazy_import('pyarrow.csv')
+
+    Nothing is looked up until then, not even the parent packages of a
+    dotted name (finding `a.b` imports `a`), so a missing module raises
+    ModuleNotFoundError on first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+def page_imports(path):
+    """Source of the top-level import statements of a page script."""
+    source = Path(path).read_text(encoding='utf-8')
+    tree = ast.parse(source)
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return '\n'.join(ast.get_source_segment(source, node) for node in nodes)
+
+
+def parse_importtime(stderr):
+    """Per-module (self, cumulative) import times in ms from `python -X importtime`."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = {
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            'depth': depth,
+        }
+    return modules
+
+
+def profile_page(path):
+    """Import time of one page's imports, measured in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', page_imports(path)],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': str(ROOT_DIR)},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {Path(path).name} failed:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+    # Modules imported directly by the page (depth 0) add up to its total
+    top_level = {name: m for name, m in modules.items() if m['depth'] == 0}
+    return {
+        'total_ms': round(sum(m['cumulative_ms'] for m in top_level.values()), 1),
+        'modules': len(modules),
+        'top_level': {name: m['cumulative_ms'] for name, m in
+                      sorted(top_level.items(), key=lambda item: -item[1]['cumulative_ms'])},
+        'self_ms': {name: m['self_ms'] for name, m in
+                    sorted(modules.items(), key=lambda item: -item[1]['self_ms'])},
+    }
+
+
+def profile_pages(pages=PAGES):
+    return {Path(page).name: profile_page(page) for page in pages}
+
+
+def print_report(report, top=10, baseline=None):
+    for page, profile in report.items():
+        line = f"{page}: {profile['total_ms']:.0f} ms, {profile['modules']} modules"
+        if baseline and page in baseline:
+            line += f" ({profile['total_ms'] - baseline[page]['total_ms']:+.0f} ms)"
+        print(line)
+        for name, ms in list(profile['top_level'].items())[:top]:
+            print(f"    {ms:8.1f} ms  {name}")
+        slowest = ', '.join(f"{name} {ms:.1f}" for name, ms in list(profile['self_ms'].items())[:5])
+        print(f"    slowest modules (self, ms): {slowest}")
+
+
+def regressions(report, baseline, threshold=0.2, min_ms=20):
+    """Pages whose import time grew by more than `threshold` (and `min_ms`) since `baseline`."""
+    slower = []
+    for page, profile in report.items():
+        before = baseline.get(page, {}).get('total_ms')
+        if before is None:
+            continue
+        if profile['total_ms'] - before > max(min_ms, threshold * before):
+            slower.append((page, before, profile['total_ms']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time of each page, in a fresh interpreter per page")
+    parser.add_argument('pages', nargs='*', help="page scripts (default: Intro.py and pages/*.py)")
+    parser.add_argument('--top', type=int, default=10, help="top-level imports listed per page")
+    parser.add_argument('--output', help="write the report as JSON")
+    parser.add_argument('--compare', help="previous JSON report; exit 1 if a page got slower")
+    args = parser.parse_args(argv)
+
+    report = profile_pages(args.pages or PAGES)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, top=args.top, baseline=baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if baseline:
+        slower = regressions(report, baseline)
+        for page, before, after in slower:
+            print(f"REGRESSION {page}: {before:.0f} ms -> {after:.0f} ms")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Memory report of the loaded datasets, per column.
+
+    python -m utils.memory                     # every local dataset
+    python -m utils.memory discogs --compare   # also against an untyped load of the CSV
+
+For every column: its dtype and the bytes it holds (strings included, so
+object columns count their Python strings). With --compare, the same for
+the CSV read without a schema (object strings, 64-bit numbers), which is
+how the datasets used to be loaded. Columns read from a snapshot are mostly
+memory-mapped, i.e. shared by every process of the server.
+"""
+import argparse
+import resource
+import sys
+
+import pandas as pd
+
+MB = 2 ** 20
+
+
+def column_memory(df):
+    """Dtype and bytes of every column of `df`."""
+    return pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'MB': df.memory_usage(index=False, deep=True) / MB,
+    })
+
+
+def memory_report(name, compare=False):
+    from utils.data import dataset_path, load_dataset
+
+    report = column_memory(load_dataset(name))
+    if compare:
+        untyped = column_memory(pd.read_csv(dataset_path(name)))
+        report = report.join(untyped, rsuffix=' untyped')
+        report['ratio'] = report['MB untyped'] / report['MB']
+    return report
+
+
+def main(argv=None):
+    from utils.data import DATASETS, is_available
+
+    parser = argparse.ArgumentParser(description="Memory used by the loaded datasets, per column")
+    parser.add_argument('datasets', nargs='*', metavar='dataset',
+                        help=f"datasets to report ({', '.join(DATASETS)}; default: those available locally)")
+    parser.add_argument('--compare', action='store_true', help="compare with the CSV loaded without a schema")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+
+    names = args.datasets or [name for name in DATASETS if is_available(name)]
+    with pd.option_context('display.width', 200, 'display.float_format', '{:,.2f}'.format):
+        for name in names:
+            report = memory_report(name, compare=args.compare)
+            print(f"\n{name}")
+            print(report.to_string())
+            total = report['MB'].sum()
+            line = f"total: {total:,.1f} MB"
+            if args.compare:
+                untyped = report['MB untyped'].sum()
+                line += f" (untyped: {untyped:,.1f} MB, {untyped / total:.1f}x)"
+            print(line)
+    # ru_maxrss is in kilobytes on Linux
+    print(f"\npeak RSS of this process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
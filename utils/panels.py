@@ -0,0 +1,38 @@
+import threading
+
+import streamlit as st
+
+# Set by the warm-up (see utils/warmup.py), which runs every page once per tab
+_warmup = threading.local()
+
+
+def lazy_tabs(labels, key):
+    """Tab-like selector that only lets the selected panel run.
+
+    Unlike st.tabs, which executes and sends every panel on each rerun, the
+    page renders just the panel whose label is returned here:
+
+        selected = lazy_tabs(["Units Sold", "Revenue"], key="sales_tab")
+        if selected == "Units Sold":
+            ...
+    """
+    tab = getattr(_warmup, 'tab', None)
+    if tab is not None:
+        _warmup.n_tabs = max(_warmup.n_tabs, len(labels))
+        return labels[min(tab, len(labels) - 1)]
+    return st.radio(key, labels, horizontal=True, key=key, label_visibility="collapsed")
+
+
+def run_every_tab(run):
+    """Call `run()` once per tab, so every panel of a page is rendered once (used by the warm-up)."""
+    _warmup.tab = 0
+    try:
+        while True:
+            _warmup.n_tabs = 1
+            run()
+            _warmup.tab += 1
+            if _warmup.tab >= _warmup.n_tabs:
+                break
+    finally:
+        _warmup.tab = None
+
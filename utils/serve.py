@@ -0,0 +1,135 @@
+"""Run the app as several Streamlit processes sharing one copy of the data.
+
+    python -m utils.serve --workers 4                  # ports 8501-8504
+    python -m utils.serve --workers 2 --base-port 9000 --report 60
+
+The snapshots and aggregate cubes are brought up to date once, here, and
+every worker then memory-maps the same files: snapshot columns (strings
+included), the style index and the arrays of the cubes are read-only
+views of the page cache, so N workers hold one copy of
+them instead of N. What each worker still builds for itself is small: the
+categorical codes, the filter indexes and the per-selection results.
+Each worker warms its caches in the background as it starts (see
+utils/warmup.py). With METRICS_PORT set, worker i serves its /metrics and
+/ready on METRICS_PORT + i, so each one can be health-checked on its own.
+
+Streamlit sessions live in the process that served their websocket, so put
+a sticky load balancer in front of the ports, e.g. nginx:
+
+    upstream app {
+        ip_hash;
+        server 127.0.0.1:8501;
+        server 127.0.0.1:8502;
+    }
+
+(plus the usual `proxy_http_version 1.1` and Upgrade/Connection headers for
+the websocket).
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def prepare():
+    """Bring the snapshots and cubes of every local dataset up to date, before the workers map them."""
+    from utils.aggregates import CUBES, refresh_cube
+    from utils.data import DATASETS, build_snapshot, is_available, snapshot_path, source_version, style_index_path
+    from utils.snapshots import open_snapshot
+
+    for name in DATASETS:
+        if not is_available(name):
+            print(f"Skipping {name}: no local copy found")
+            continue
+        paths = [snapshot_path(name)]
+        if 'styles' in DATASETS[name]['dtype']:
+            paths.append(style_index_path(name))
+        readers = [open_snapshot(path, source_version(name)) for path in paths]
+        # Snapshots written in several batches (older versions) can't be used in place
+        if any(reader is None or reader.num_record_batches > 1 for reader in readers):
+            build_snapshot(name)
+            print(f"Snapshot written for {name}")
+        if name in CUBES:
+            refresh_cube(name)
+
+
+def memory_usage(pid):
+    """(RSS, PSS) of a process in bytes; PSS splits shared pages between the processes mapping them."""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                usage[key] = int(value.split()[0]) * 1024
+    return usage.get('Rss', 0), usage.get('Pss', 0)
+
+
+def report(workers):
+    total_rss = total_pss = 0
+    for port, process in workers:
+        try:
+            rss, pss = memory_usage(process.pid)
+        except OSError:
+            continue
+        total_rss += rss
+        total_pss += pss
+        print(f"  :{port}  pid {process.pid}  RSS {rss / 2**20:,.0f} MB  PSS {pss / 2**20:,.0f} MB")
+    print(f"  total  RSS {total_rss / 2**20:,.0f} MB  PSS {total_pss / 2**20:,.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the app from several processes sharing the data")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    parser.add_argument('--base-port', type=int, default=8501, help="port of the first worker")
+    parser.add_argument('--report', type=float, default=0, metavar='SECONDS',
+                        help="print the workers' memory use every SECONDS (Linux only)")
+    parser.add_argument('--no-prepare', action='store_true', help="don't rebuild stale snapshots and cubes first")
+    parser.add_argument('--no-warmup', action='store_true', help="don't warm the workers' caches at start")
+    args = parser.parse_args(argv)
+
+    if not args.no_prepare:
+        prepare()
+    metrics_port = os.environ.get('METRICS_PORT')
+    workers = []
+    for i in range(args.workers):
+        port = args.base_port + i
+        # utils.warmup takes the arguments of `streamlit run`
+        runner = ['streamlit', 'run'] if args.no_warmup else ['utils.warmup']
+        command = [sys.executable, '-m', *runner, 'Intro.py', '--server.port', str(port), '--server.headless', 'true']
+        env = dict(os.environ)
+        if metrics_port:
+            env['METRICS_PORT'] = str(int(metrics_port) + i)
+        workers.append((port, subprocess.Popen(command, cwd=ROOT_DIR, env=env)))
+        print(f"Worker {i + 1} on port {port}" + (f", metrics on port {env['METRICS_PORT']}" if metrics_port else ''))
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while all(process.poll() is None for _, process in workers):
+            time.sleep(args.report or 1)
+            if args.report:
+                report(workers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for _, process in workers:
+            process.terminate()
+        for _, process in workers:
+            process.wait()
+    # A worker that exited on its own (not stopped here) is an error
+    failed = [port for port, process in workers if process.returncode not in (0, -signal.SIGTERM)]
+    if failed:
+        print(f"Worker(s) on port {', '.join(map(str, failed))} exited unexpectedly")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Mergeable sketches for rankings and distinct counts in bounded memory.
+
+- `FrequentItems` keeps approximate counts of the most frequent values
+  (Misra-Gries / Space-Saving), e.g. for top-N rankings.
+- `HyperLogLog` estimates distinct counts per key, e.g. unique labels per
+  (year, genre).
+- `QuantileSketch` keeps the distribution of a numeric column in
+  log-spaced buckets, for quantiles, box statistics and histograms.
+
+They are built from a batch at a time and merged across batches, delta
+partitions or workers without losing their error guarantees, and they
+report their error bound.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_PRECISION = 12
+DEFAULT_ACCURACY = 0.001
+
+
+class FrequentItems:
+    """Approximate counts of the most frequent values, with at most `capacity` counters.
+
+    Kept counts are lower bounds, at most `error` below the true counts, and
+    a value that was dropped occurs at most `error` times. `error` stays
+    below n / (capacity + 1) for n counted values, also across merges.
+    """
+
+    def __init__(self, counts, capacity=DEFAULT_CAPACITY, error=0, n=0):
+        self.counts = counts.astype('int64')
+        self.capacity = capacity
+        self.error = int(error)
+        self.n = int(n)
+        self._reduce()
+
+    @classmethod
+    def from_counts(cls, counts, capacity=DEFAULT_CAPACITY):
+        """Summary of exact counts (e.g. one batch's value counts)."""
+        return cls(counts, capacity, n=counts.sum())
+
+    def _reduce(self):
+        if len(self.counts) <= self.capacity:
+            return
+        # Misra-Gries: take the (capacity+1)-th largest count off every counter
+        cut = int(np.partition(self.counts.to_numpy(), -(self.capacity + 1))[-(self.capacity + 1)])
+        counts = self.counts - cut
+        self.counts = counts[counts > 0]
+        self.error += cut
+
+    def merge(self, other):
+        counts = self.counts.add(other.counts, fill_value=0)
+        return FrequentItems(counts, max(self.capacity, other.capacity), self.error + other.error,
+                             self.n + other.n)
+
+    def top(self, n=None):
+        """Counts of the most frequent values, largest first (lower bounds)."""
+        top = self.counts.sort_values(ascending=False, kind='stable')
+        return top if n is None else top.head(n)
+
+
+def _bit_length(x):
+    # Exact for 32-bit values, which float64 represents without rounding
+    return np.frexp(x.astype('float64'))[1]
+
+
+def _leading_zeros(x):
+    high, low = x >> np.uint64(32), x & np.uint64(0xFFFFFFFF)
+    return np.where(high > 0, 32 - _bit_length(high), 64 - _bit_length(low))
+
+
+class HyperLogLog:
+    """Distinct counts per key in fixed memory: 2**precision one-byte registers per key.
+
+    The relative standard error of an estimate is 1.04 / sqrt(2**precision),
+    about 1.6% at the default precision.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, keys=None, registers=None):
+        self.precision = precision
+        self.keys = keys if keys is not None else pd.Index([])
+        m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros((len(self.keys), m), dtype='uint8')
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(1 << self.precision)
+
+    @classmethod
+    def from_values(cls, keys, values, precision=DEFAULT_PRECISION):
+        """Sketch of the distinct `values` per key; `keys` is an Index (or MultiIndex) aligned with them."""
+        codes, uniques = keys.factorize()
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        p = np.uint64(precision)
+        buckets = (hashes >> (np.uint64(64) - p)).astype('int64')
+        # A guard bit caps the rank when the remaining bits are all zero
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        ranks = (_leading_zeros(rest) + 1).astype('uint8')
+        registers = np.zeros((len(uniques), 1 << precision), dtype='uint8')
+        np.maximum.at(registers, (codes, buckets), ranks)
+        return cls(precision, uniques, registers)
+
+    def merge(self, other):
+        if not len(other.keys):
+            return self
+        if not len(self.keys):
+            return other
+        keys = self.keys.union(other.keys)
+        registers = np.zeros((len(keys), 1 << self.precision), dtype='uint8')
+        for sketch in (self, other):
+            rows = keys.get_indexer(sketch.keys)
+            registers[rows] = np.maximum(registers[rows], sketch.registers)
+        return HyperLogLog(self.precision, keys, registers)
+
+    def estimate(self):
+        """Estimated number of distinct values per key."""
+        m = 1 << self.precision
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.exp2(-self.registers.astype('float64')).sum(axis=1)
+        zeros = (self.registers == 0).sum(axis=1)
+        # Linear counting is more accurate while many registers are still empty
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        linear = m * np.log(m / np.maximum(zeros, 1))
+        estimate = np.where(small, linear, raw)
+        return pd.Series(np.rint(estimate).astype('int64'), index=self.keys).sort_index()
+
+
+class QuantileSketch:
+    """Distribution of non-negative values in log-spaced buckets of 1 + value (as in DDSketch).
+
+    Quantiles are within `relative_accuracy` of 1 + the true quantile; the
+    count, mean, minimum and maximum are exact. The number of buckets only
+    grows with the log of the range of the values (about 5,000 for 0 to
+    20,000 at the default accuracy), not with their number.
+    """
+
+    def __init__(self, counts=None, relative_accuracy=DEFAULT_ACCURACY, total=0.0, low=np.inf, high=-np.inf):
+        self.counts = counts if counts is not None else pd.Series([], dtype='int64')
+        self.relative_accuracy = relative_accuracy
+        self.total = float(total)
+        self.low = float(low)
+        self.high = float(high)
+
+    @property
+    def gamma(self):
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=DEFAULT_ACCURACY):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        sketch = cls(relative_accuracy=relative_accuracy)
+        if not len(values):
+            return sketch
+        # Bucket i holds 1 + value in (gamma**(i - 1), gamma**i]
+        buckets = np.ceil(np.log1p(np.maximum(values, 0)) / np.log(sketch.gamma)).astype('int64')
+        keys, counts = np.unique(buckets, return_counts=True)
+        return cls(pd.Series(counts.astype('int64'), index=keys), relative_accuracy, values.sum(),
+                   values.min(), values.max())
+
+    def merge(self, other):
+        if not len(other.counts):
+            return self
+        if not len(self.counts):
+            return other
+        counts = self.counts.add(other.counts, fill_value=0).astype('int64')
+        return QuantileSketch(counts, self.relative_accuracy, self.total + other.total,
+                              min(self.low, other.low), max(self.high, other.high))
+
+    def values(self):
+        """Representative value of every bucket, within the exact minimum and maximum."""
+        gamma = self.gamma
+        values = 2 * np.power(gamma, self.counts.index.to_numpy(dtype='float64')) / (gamma + 1) - 1
+        return np.clip(values, self.low, self.high)
+
+    def quantile(self, q):
+        ranks = np.asarray(q, dtype='float64') * (self.n - 1)
+        positions = np.searchsorted(np.cumsum(self.counts.to_numpy()), ranks, side='right')
+        return self.values()[np.minimum(positions, len(self.counts) - 1)]
+
+    def summary(self, bins=30):
+        """Histogram ('edges', 'counts') and box statistics of the values, for `utils.charts.binned_histogram`.
+
+        The box statistics are approximate (within the sketch's accuracy);
+        whiskers end at the most extreme values inside 1.5 IQR, as in plotly's box.
+        """
+        if not len(self.counts):
+            return {'edges': [], 'counts': [], 'count': 0}
+        values, counts = self.values(), self.counts.to_numpy()
+        if self.high > self.low:
+            # Equal-width bins over the range, with the inner edges moved to the nearest bucket
+            # boundary (gamma**i - 1): every bucket then falls in one bin and the counts are exact
+            log_gamma = np.log(self.gamma)
+            targets = np.linspace(self.low, self.high, bins + 1)
+            cuts = np.rint(np.log1p(np.maximum(targets[1:-1], 0)) / log_gamma)
+            edges = np.concatenate([[self.low], np.clip(np.expm1(cuts * log_gamma), self.low, self.high),
+                                    [self.high]])
+            edges = np.maximum.accumulate(edges)
+            bin_of_bucket = np.searchsorted(cuts, self.counts.index.to_numpy(), side='left')
+            histogram = np.bincount(bin_of_bucket, weights=counts, minlength=bins)
+        else:
+            # All values equal: one bin around them, like np.histogram
+            histogram, edges = np.histogram(values, bins=bins, range=(self.low - 0.5, self.high + 0.5),
+                                            weights=counts)
+        q1, median, q3 = self.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+        return {
+            'edges': edges.tolist(),
+            'counts': histogram.astype('int64').tolist(),
+            'count': self.n,
+            'q1': float(q1),
+            'median': float(median),
+            'q3': float(q3),
+            'lowerfence': float(inside.min()),
+            'upperfence': float(inside.max()),
+            'mean': self.total / self.n,
+        }
@@ -0,0 +1,138 @@
+import mmap
+import os
+import pickle
+import struct
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.styles import StyleIndex
+
+# Schema metadata key holding the fingerprint of the CSV a snapshot was built from
+SOURCE_VERSION_KEY = b'source_version'
+
+MAPPED_PICKLE_MAGIC = b'MAPPKL01'
+ALIGNMENT = 64
+
+
+def to_categories(df, columns):
+    """Encode the given low-cardinality string columns as categoricals.
+
+    Categories are sorted plain strings whatever the column's string dtype,
+    the same as a snapshot's dictionary columns load as.
+    """
+    columns = [col for col in columns if col in df.columns]
+    encoded = {}
+    for col in columns:
+        codes, categories = pd.factorize(df[col], sort=True)
+        encoded[col] = pd.Categorical.from_codes(codes, categories.astype(object))
+    return df.assign(**encoded)
+
+
+def _write_table(table, path, source_version):
+    # Uncompressed Arrow IPC in a single record batch, so the file can be
+    # memory-mapped on load and its columns used in place, without copies
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_VERSION_KEY] = source_version.encode()
+    table = table.replace_schema_metadata(metadata).combine_chunks()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Per-process temp name: several workers may write the same snapshot at once
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=max(table.num_rows, 1))
+    tmp_path.replace(path)
+
+
+def write_snapshot(df, path, source_version):
+    _write_table(pa.Table.from_pandas(df, preserve_index=False), path, source_version)
+
+
+def write_style_index(index, path, source_version):
+    _write_table(pa.table({'styles': index.to_arrow()}), path, source_version)
+
+
+def open_snapshot(path, source_version):
+    """Memory-mapped batch reader over a snapshot, or None if it is missing or stale."""
+    if not path.exists():
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    metadata = reader.schema.metadata or {}
+    if metadata.get(SOURCE_VERSION_KEY) != source_version.encode():
+        return None
+    return reader
+
+
+def _arrow_strings(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def read_snapshot(path, source_version, arrow_strings=False):
+    """Memory-map a snapshot, or return None if it is missing or stale.
+
+    Null-free numeric columns stay backed by the mapped file (split_blocks).
+    With `arrow_strings`, so do the string columns, as Arrow-backed strings
+    rather than Python objects; the mapped pages are then shared by every
+    process reading the snapshot.
+    """
+    reader = open_snapshot(path, source_version)
+    if reader is None:
+        return None
+    types_mapper = _arrow_strings if arrow_strings else None
+    return reader.read_all().to_pandas(split_blocks=True, types_mapper=types_mapper)
+
+
+def read_style_index(path, source_version):
+    """Style index over the arrays of a memory-mapped snapshot, or None if missing or stale."""
+    reader = open_snapshot(path, source_version)
+    if reader is None:
+        return None
+    styles = reader.read_all().column('styles')
+    return StyleIndex.from_arrow(styles.chunk(0) if styles.num_chunks == 1 else styles.combine_chunks())
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_mapped_pickle(obj, path):
+    """Pickle `obj` with its array buffers stored out-of-band, for `read_mapped_pickle`.
+
+    Layout: magic, pickle length, buffer count, (offset, length) of every
+    buffer, the pickle stream, then the buffers at aligned offsets.
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    raw = [buffer.raw() for buffer in buffers]
+    header_size = 24 + 16 * len(raw)
+    offset = _aligned(header_size + len(data))
+    layout = []
+    for buffer in raw:
+        layout.append((offset, buffer.nbytes))
+        offset = _aligned(offset + buffer.nbytes)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<8sQQ', MAPPED_PICKLE_MAGIC, len(data), len(raw)))
+        for entry in layout:
+            f.write(struct.pack('<QQ', *entry))
+        f.write(data)
+        for (offset, _), buffer in zip(layout, raw):
+            f.seek(offset)
+            f.write(buffer)
+    os.replace(tmp_path, path)
+
+
+def read_mapped_pickle(path):
+    """Load a `write_mapped_pickle` file; its arrays stay (read-only) in the mapped file."""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, data_size, n_buffers = struct.unpack_from('<8sQQ', view)
+    if magic != MAPPED_PICKLE_MAGIC:
+        raise ValueError(f"{path} is not a mapped pickle")
+    layout = [struct.unpack_from('<QQ', view, 24 + 16 * i) for i in range(n_buffers)]
+    start = 24 + 16 * n_buffers
+    return pickle.loads(view[start:start + data_size],
+                        buffers=[view[offset:offset + size] for offset, size in layout])
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class StyleIndex:
+    """Integer-coded release -> style mapping in CSR form.
+
+    The styles of release ``i`` are ``vocabulary[codes[offsets[i]:offsets[i + 1]]]``.
+    Counting by style, or by style and any per-release key (year, format, ...),
+    is a bincount over the codes, so no strings are split or copied per query.
+    """
+
+    def __init__(self, offsets, codes, vocabulary):
+        self.offsets = np.asarray(offsets, dtype='int64')
+        self.codes = np.asarray(codes, dtype='int32')
+        self.vocabulary = pd.Index(vocabulary, name='styles')
+        # Shared across sessions, so the arrays are frozen
+        self.offsets.flags.writeable = False
+        self.codes.flags.writeable = False
+
+    @classmethod
+    def from_strings(cls, styles):
+        """Build the index from comma-joined style strings (a Series or Arrow array)."""
+        if isinstance(styles, pd.Series):
+            styles = pa.array(styles.astype(object), type=pa.string())
+        elif isinstance(styles, pa.ChunkedArray):
+            styles = styles.combine_chunks()
+        split = pc.split_pattern(styles, ',')
+        lengths = pc.fill_null(pc.list_value_length(split), 0).to_numpy()
+        flat = pc.utf8_trim_whitespace(pc.list_flatten(split))
+        # Dictionary codes follow first appearance, like pandas' value_counts ties
+        encoded = pc.dictionary_encode(flat)
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets, encoded.indices.to_numpy(), encoded.dictionary.to_pandas())
+
+    @classmethod
+    def from_arrow(cls, styles):
+        """Build the index from a list<dictionary> array written by `to_arrow`.
+
+        The offsets and codes stay backed by the array's buffers (e.g. a
+        memory-mapped snapshot), so nothing is decoded or copied.
+        """
+        values = styles.values
+        return cls(styles.offsets.to_numpy(), values.indices.to_numpy(), values.dictionary.to_pandas())
+
+    def to_arrow(self):
+        """The index as one list of dictionary-encoded styles per release."""
+        values = pa.DictionaryArray.from_arrays(pa.array(self.codes, type=pa.int32()),
+                                                pa.array(self.vocabulary.to_numpy(dtype=object), type=pa.string()))
+        return pa.LargeListArray.from_arrays(pa.array(self.offsets, type=pa.int64()), values)
+
+    @property
+    def n_releases(self):
+        return len(self.offsets) - 1
+
+    @property
+    def release_rows(self):
+        """Release row of every (release, style) entry."""
+        return np.repeat(np.arange(self.n_releases), np.diff(self.offsets))
+
+    def _entry_mask(self, mask):
+        if mask is None:
+            return None
+        return np.asarray(mask, dtype=bool)[self.release_rows]
+
+    def style_counts(self, mask=None):
+        """Number of releases per style, most common first."""
+        codes = self.codes
+        entry_mask = self._entry_mask(mask)
+        if entry_mask is not None:
+            codes = codes[entry_mask]
+        counts = np.bincount(codes, minlength=len(self.vocabulary))
+        result = pd.Series(counts, index=self.vocabulary, name='count')
+        return result[result > 0].sort_values(ascending=False)
+
+    def counts_by(self, keys, mask=None):
+        """Number of releases per (key, style), for a per-release key array.
+
+        Returns a Series indexed by (key, styles) holding only the pairs that
+        occur, sorted by key and style name.
+        """
+        keys = pd.Series(keys).reset_index(drop=True)
+        key_codes, key_values = pd.factorize(keys, sort=True)
+        # Plain values, so categorical keys give the same index as their strings
+        key_values = pd.Index(np.asarray(key_values))
+        combined = key_codes.astype('int64')[self.release_rows] * len(self.vocabulary) + self.codes
+        entry_mask = self._entry_mask(mask)
+        if entry_mask is not None:
+            combined = combined[entry_mask]
+        # Releases with a missing key are dropped, like a groupby does
+        combined = combined[combined >= 0]
+        pairs, counts = np.unique(combined, return_counts=True)
+        index = pd.MultiIndex.from_arrays(
+            [key_values.take(pairs // len(self.vocabulary)), self.vocabulary.take(pairs % len(self.vocabulary))],
+            names=[keys.name, 'styles'],
+        )
+        return pd.Series(counts, index=index, name='count').sort_index()
+
+    def incidence(self, mask=None):
+        """Sparse release x style matrix, 1 where a release has a style.
+
+        It has the same CSR layout as the index (offsets and codes), so it is
+        built without any sorting or grouping. Unselected releases become
+        empty rows.
+        """
+        from scipy import sparse
+
+        data = np.ones(len(self.codes), dtype='int32')
+        entry_mask = self._entry_mask(mask)
+        if entry_mask is not None:
+            data[~entry_mask] = 0
+        # Copied: the index arrays are read-only and scipy sorts them in place
+        matrix = sparse.csr_matrix((data, self.codes, self.offsets), shape=(self.n_releases, len(self.vocabulary)),
+                                   copy=True)
+        # A style listed twice on a release still counts once
+        matrix.sum_duplicates()
+        matrix.eliminate_zeros()
+        matrix.data[:] = 1
+        return matrix
+
+    def cooccurrence(self, mask=None):
+        """Sparse style x style matrix of the number of releases having both styles.
+
+        The diagonal holds the number of releases per style.
+        """
+        incidence = self.incidence(mask)
+        return (incidence.T @ incidence).tocsr()
+
+    def append(self, other):
+        """Index of this index's releases followed by those of `other`.
+
+        Styles new to this index are added at the end of the vocabulary, so
+        existing codes (and first-appearance order) stay as they are.
+        """
+        vocabulary = self.vocabulary.append(other.vocabulary[~other.vocabulary.isin(self.vocabulary)])
+        codes = vocabulary.get_indexer(other.vocabulary)[other.codes]
+        return StyleIndex(
+            np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]]),
+            np.concatenate([self.codes, codes]),
+            vocabulary,
+        )
+
+    def subset(self, mask):
+        """Index of just the releases selected by a boolean `mask`, in order."""
+        mask = np.asarray(mask, dtype=bool)
+        lengths = np.diff(self.offsets)[mask]
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        return StyleIndex(offsets, self.codes[mask[self.release_rows]], self.vocabulary)
+
+    def explode(self):
+        """Long (row, styles) arrays, e.g. to join the styles back onto the releases."""
+        return self.release_rows, self.vocabulary.take(self.codes)
@@ -0,0 +1,306 @@
+"""Lightweight timing spans and Prometheus-style metrics.
+
+Wrap the interesting parts of a page in spans:
+
+    trace_page('page3')
+    with span('aggregate:top formats'):
+        ...
+    debug_panel()
+
+Spans of the current rerun are shown as a waterfall by `debug_panel` when the
+page is opened with `?debug=1` (or APP_DEBUG=1 is set). Every span, rerun,
+cache lookup and figure sent also feeds the process-wide `metrics`, exposed in
+the Prometheus text format:
+
+- METRICS_FILE=<path> rewrites the file at the end of every rerun
+- METRICS_PORT=<port> serves it on http://<host>:<port>/metrics (one port
+  per process; utils.serve gives worker i the port METRICS_PORT + i)
+
+The same port answers /ready with 200 once every readiness check registered
+with `add_readiness_check` passes (e.g. the cache warm-up), 503 before.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRIC_HELP = {
+    'app_rerun_duration_seconds': "Duration of a page rerun",
+    'app_span_duration_seconds': "Duration of a traced section",
+    'app_cache_lookups_total': "Cache lookups, by cache and result",
+    'app_bytes_sent_total': "Bytes of chart and table payloads sent to browsers",
+    'app_api_requests_total': "Requests to the JSON API (utils/api.py), by endpoint and status",
+}
+
+
+_readiness_checks = []
+
+
+def add_readiness_check(check):
+    """Register a callable that returns whether the process is ready to serve."""
+    _readiness_checks.append(check)
+
+
+def is_ready():
+    return all(check() for check in _readiness_checks)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+class Metrics:
+    """Thread-safe counters, histograms and gauges, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[name, _label_key(labels)] += value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def gauge(self, name, read, help_text=''):
+        """Register a gauge whose value is read (by calling `read()`) when rendering."""
+        with self._lock:
+            self._gauges[name] = (read, help_text)
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, 'buckets': list(h['buckets'])} for key, h in self._histograms.items()}
+            gauges = dict(self._gauges)
+        lines = []
+        described = set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in sorted(counters.items()):
+            describe(name, 'counter', METRIC_HELP.get(name, name))
+            lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for (name, key), histogram in sorted(histograms.items()):
+            describe(name, 'histogram', METRIC_HELP.get(name, name))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        for name, (read, help_text) in sorted(gauges.items()):
+            describe(name, 'gauge', help_text or name)
+            lines.append(f"{name} {read():g}")
+        return '\n'.join(lines) + '\n'
+
+
+# One registry per process, shared by every session
+metrics = Metrics()
+
+_local = threading.local()
+
+
+def _current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name):
+    """Time a section; recorded in the current rerun's trace and in the metrics."""
+    trace = _current_trace()
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _local.depth = depth
+        metrics.observe('app_span_duration_seconds', end - start, span=name)
+        if trace is not None:
+            trace['spans'].append({'name': name, 'start': start - trace['start'], 'seconds': end - start,
+                                   'depth': depth})
+
+
+def count_cache_lookup(cache, hit):
+    metrics.inc('app_cache_lookups_total', cache=cache, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def cache_lookup(cache):
+    """Count a lookup in a cached function as a hit unless its body calls `cache_miss()`."""
+    frames = _local.__dict__.setdefault('lookups', [])
+    frame = {'miss': False}
+    frames.append(frame)
+    try:
+        yield
+    finally:
+        frames.pop()
+        count_cache_lookup(cache, hit=not frame['miss'])
+
+
+def cache_miss():
+    """Call from the body of a cached function: it only runs on a miss."""
+    frames = getattr(_local, 'lookups', None)
+    if frames:
+        frames[-1]['miss'] = True
+
+
+def count_bytes_sent(kind, n_bytes):
+    metrics.inc('app_bytes_sent_total', n_bytes, kind=kind)
+
+
+def trace_page(page):
+    """Start the trace of this rerun; call at the top of a page."""
+    _local.trace = {'page': page, 'start': time.perf_counter(), 'spans': []}
+    _local.depth = 0
+    start_exporters()
+
+
+def end_trace():
+    """Close the trace of this rerun, record its duration and export the metrics."""
+    trace = _current_trace()
+    if trace is None:
+        return None
+    _local.trace = None
+    trace['seconds'] = time.perf_counter() - trace['start']
+    metrics.observe('app_rerun_duration_seconds', trace['seconds'], page=trace['page'])
+    write_metrics_file()
+    return trace
+
+
+def debug_enabled():
+    return os.environ.get('APP_DEBUG') == '1' or st.query_params.get('debug') == '1'
+
+
+def waterfall_figure(trace):
+    import plotly.graph_objects as go
+
+    spans = sorted(trace['spans'], key=lambda s: s['start'])
+    names = [('\u00a0\u00a0' * s['depth']) + s['name'] for s in spans]
+    # One row per span, in start order, even when a name occurs more than once
+    rows = list(range(len(spans)))
+    fig = go.Figure(go.Bar(
+        y=rows, x=[s['seconds'] * 1000 for s in spans], base=[s['start'] * 1000 for s in spans],
+        orientation='h', marker_color='#A020F0', customdata=names,
+        hovertemplate="%{customdata}: %{x:.1f} ms<extra></extra>",
+    ))
+    fig.update_yaxes(autorange='reversed', tickvals=rows, ticktext=names)
+    fig.update_layout(title=f"{trace['page']}: {trace['seconds'] * 1000:.0f} ms",
+                      xaxis_title='ms since the rerun started', height=max(250, 24 * len(spans) + 120))
+    return fig
+
+
+def debug_panel():
+    """End the rerun's trace and, when debugging is on, show its timing waterfall."""
+    trace = end_trace()
+    if trace is None or not debug_enabled():
+        return
+    with st.expander("Timings of this rerun", expanded=True):
+        if trace['spans']:
+            st.plotly_chart(waterfall_figure(trace), use_container_width=True)
+        st.code(metrics.render(), language='text')
+
+
+def write_metrics_file(path=None):
+    path = path or os.environ.get('METRICS_FILE')
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/ready':
+            ready = is_ready()
+            body = b'ready\n' if ready else b'warming up\n'
+            self.send_response(200 if ready else 503)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporter_lock = threading.Lock()
+_metrics_server = None
+_exporters_started = False
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve /metrics from a daemon thread (once per process)."""
+    global _metrics_server
+    with _exporter_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name='metrics', daemon=True).start()
+    return _metrics_server
+
+
+def start_exporters():
+    """Start the METRICS_PORT server, if configured (once per process; also done by `trace_page`)."""
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+    port = os.environ.get('METRICS_PORT')
+    if port:
+        try:
+            serve_metrics(int(port))
+        except OSError as exc:
+            # E.g. the port is taken (utils.serve gives each worker its own)
+            logging.getLogger(__name__).warning("Not serving metrics on port %s: %s", port, exc)
@@ -0,0 +1,122 @@
+"""Warm a server process's caches in the background as soon as it starts.
+
+    python -m utils.warmup Intro.py --server.port 8501    # instead of `streamlit run Intro.py ...`
+
+Once the Streamlit runtime exists, a thread pool loads every local dataset
+(including the download of the full catalogue), its style index, aggregate
+cube and filter index. Then every page is run headless, once per tab, so
+the figures of the unfiltered pages are in the figure cache too and the
+image variants exist. The first visitors then only hit warm caches.
+
+Readiness is reported by `is_ready()` in utils/tracing.py: the
+app_warmup_ready gauge in the metrics and /ready on METRICS_PORT (503
+while warming up, 200 afterwards), for a load balancer's health check.
+APP_WARMUP_WORKERS sets the size of the pool (default: CPU count).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PAGES = [ROOT_DIR / 'Intro.py'] + sorted((ROOT_DIR / 'pages').glob('*.py'))
+THREAD_PREFIX = 'warmup'
+
+logger = logging.getLogger(__name__)
+
+ready = threading.Event()
+status = {'started': None, 'seconds': None, 'errors': []}
+_start_lock = threading.Lock()
+_warmup_started = False
+
+
+class _QuietWarmupThreads(logging.Filter):
+    # Pages run without a session, which Streamlit warns about on every call
+    def filter(self, record):
+        return not threading.current_thread().name.startswith(THREAD_PREFIX)
+
+
+def _task(name, work):
+    start = time.perf_counter()
+    try:
+        work()
+    except Exception as exc:
+        status['errors'].append(f"{name}: {exc!r}")
+        logger.exception("Warm-up of %s failed", name)
+        return
+    logger.info("Warmed %s in %.1fs", name, time.perf_counter() - start)
+
+
+def warm_dataset(name):
+    from utils.aggregates import CUBES, load_cube
+    from utils.data import DATASETS, load_dataset, load_style_index
+    from utils.filters import load_filter_index
+
+    load_dataset(name)
+    if 'styles' in DATASETS[name]['dtype']:
+        load_style_index(name)
+    if name in CUBES:
+        load_cube(name)
+    if name != 'music_sales':
+        load_filter_index(name)
+
+
+def warm_page(path):
+    from utils.panels import run_every_tab
+
+    code = compile(path.read_text(encoding='utf-8'), str(path), 'exec')
+    run_every_tab(lambda: exec(code, {'__name__': '__main__', '__file__': str(path)}))
+
+
+def warm_up(max_workers=None):
+    """Load the datasets and aggregates, then build every page's figures; sets `ready` when done."""
+    from streamlit import runtime
+    from utils.data import DATASETS, is_available
+
+    # Cached functions only cache once the Streamlit runtime exists
+    while not runtime.exists():
+        time.sleep(0.1)
+    start = time.perf_counter()
+    status['started'] = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=THREAD_PREFIX) as pool:
+        # The full catalogue is downloaded when it isn't in the local cache yet
+        datasets = [pool.submit(_task, name, lambda name=name: warm_dataset(name))
+                    for name in DATASETS if name == 'discogs' or is_available(name)]
+        wait(datasets)
+        wait([pool.submit(_task, path.stem, lambda path=path: warm_page(path)) for path in PAGES])
+    status['seconds'] = time.perf_counter() - start
+    ready.set()
+    print(f"Warm-up finished in {status['seconds']:.1f}s ({len(status['errors'])} error(s))", flush=True)
+
+
+def start_warmup(max_workers=None):
+    """Start the warm-up in a background thread (once per process)."""
+    from utils.tracing import add_readiness_check, metrics, start_exporters
+
+    global _warmup_started
+    with _start_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+        max_workers = max_workers or int(os.environ.get('APP_WARMUP_WORKERS', 0)) or None
+        add_readiness_check(ready.is_set)
+        metrics.gauge('app_warmup_ready', lambda: float(ready.is_set()), "Whether the cache warm-up has finished")
+        logging.getLogger('streamlit.runtime.scriptrunner.script_run_context').addFilter(_QuietWarmupThreads())
+        threading.Thread(target=warm_up, args=(max_workers,), name=f"{THREAD_PREFIX}-main", daemon=True).start()
+    start_exporters()
+
+
+def main(argv=None):
+    from streamlit.web import cli
+
+    argv = sys.argv[1:] if argv is None else argv
+    start_warmup()
+    # Same as `streamlit run <argv>`, in this process so the warm-up fills its caches
+    return cli.main(['run', *argv], prog_name='streamlit')
+
+
+if __name__ == '__main__':
+    sys.exit(main())